@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017-2019 rfgb Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (at the base of this repository). If not,
+# see <http://www.gnu.org/licenses/>
+
+"""
+Micro-benchmark for :meth:`rfgb.logic.Prover.prove`.
+
+Proves every training example of a domain against a fixed set of clauses,
+one proof at a time, and reports the number of proofs per second. Must be
+ran from the base of the repository.
+
+.. code-block:: bash
+
+                python benchmarks/prover.py
+                python benchmarks/prover.py --domain Logistics --repeat 20
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath("."))
+
+from rfgb.logic import Prover
+from rfgb.utils import Data
+
+# Clauses proved for every example of each domain.
+CLAUSES = {
+    "ToyCancer": [
+        "cancer(A):-smokes(A)",
+        "cancer(A):-friends(A,B)",
+        "cancer(A):-friends(A,B),smokes(B)",
+        "cancer(A):-friends(B,A),smokes(B)",
+        "cancer(A):-friends(A,B),friends(B,C),smokes(C)",
+    ],
+    "Logistics": [
+        "unload(A,B):-bon(A,C,B)",
+        "unload(A,B):-tin(A,B,C)",
+        "unload(A,B):-tin(A,B,C),isd(A,C)",
+        "unload(A,B):-tin(A,B,C),dname(A,C,c1)",
+        "unload(A,B):-bon(A,C,B),tin(A,B,D),isd(A,D)",
+    ],
+}
+
+
+def readDomain(domain):
+    """
+    Returns a Data object with the facts of a domain, and its examples.
+    """
+    path = "testDomains/" + domain + "/train/"
+    data = Data()
+    with open(path + "facts.txt") as f:
+        data.setFacts(f.read().splitlines())
+    examples = []
+    for name in ("pos.txt", "neg.txt"):
+        with open(path + name) as f:
+            examples += [line for line in f.read().splitlines() if line]
+    return data, examples
+
+
+def proveAll(data, examples, clauses):
+    """
+    Proves every example against every clause.
+    """
+    for clause in clauses:
+        for example in examples:
+            Prover.prove(data, example, clause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--domain", action="append", choices=sorted(CLAUSES), help="Domain(s) to run."
+    )
+    parser.add_argument("--repeat", type=int, default=10, help="Timing repeats.")
+    args = parser.parse_args()
+
+    for domain in args.domain or sorted(CLAUSES):
+        data, examples = readDomain(domain)
+        clauses = CLAUSES[domain]
+        proofs = len(examples) * len(clauses)
+
+        # Compile the knowledge base before timing.
+        proveAll(data, examples, clauses)
+
+        seconds = min(
+            timeit.repeat(
+                lambda: proveAll(data, examples, clauses), number=1, repeat=args.repeat
+            )
+        )
+        print(
+            "%-10s %5d proofs  %8.4f s  %10.1f proofs/s"
+            % (domain, proofs, seconds, proofs / seconds)
+        )
+
+
+if __name__ == "__main__":
+    main()
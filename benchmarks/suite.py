@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017-2019 rfgb Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (at the base of this repository). If not,
+# see <http://www.gnu.org/licenses/>
+
+"""
+Benchmark suite for :func:`rfgb.rdn.learn` and :func:`rfgb.rdn.infer`.
+
+Generates each domain with the given numbers of facts (see
+:func:`rfgb.cmd.generate`), then learns and infers on it in a separate
+process, and reports the time of each phase, proofs per second (examples
+evaluated against a clause, by the prover or the join engine) and peak
+memory. Must be ran from the base of the repository.
+
+Results can be saved as a baseline, and later runs compared against it:
+runs slower than the baseline by more than the tolerance are reported as
+regressions, and the exit status is then 1.
+
+With ``--vectorized``, each domain is also learned with the values of the
+examples stored in arrays (see :meth:`rfgb.utils.Data.useArrays`), and the
+times of both modes are compared.
+
+.. code-block:: bash
+
+                python benchmarks/suite.py
+                python benchmarks/suite.py --domain Logistics --facts 1000 --facts 1000000
+                python benchmarks/suite.py --save baseline.json
+                python benchmarks/suite.py --baseline baseline.json
+                python benchmarks/suite.py --vectorized --domain MoodDisorder --facts 500000
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath("."))
+
+from rfgb.cmd.generate import GENERATORS
+from rfgb.cmd.generate import TARGETS
+from rfgb.cmd.generate import generate
+
+# Metrics compared with the baseline, all of which are better when lower.
+METRICS = ["generate", "learn", "infer", "peakMemory"]
+
+
+def runOne(domain, facts, trees, seed, directory, vectorized=False):
+    """
+    Generates a domain in directory, learns and infers on it, and returns
+    the measurements.
+    """
+    from rfgb import rdn
+    from rfgb.profiling import Profiler
+
+    train = os.path.join(directory, "train") + os.sep
+    test = os.path.join(directory, "test") + os.sep
+
+    start = time.time()
+    generate(domain, train, facts, seed=seed)
+    generate(domain, test, max(facts // 4, 1), seed=seed + 1)
+    generated = time.time() - start
+
+    target = TARGETS[domain]
+    Profiler.enable()
+
+    # Learning and inference print their progress.
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        start = time.time()
+        trees = rdn.learn(
+            [target],
+            numTrees=trees,
+            path=train,
+            saveJson=False,
+            vectorized=vectorized,
+        )
+        learned = time.time() - start
+
+        start = time.time()
+        rdn.infer(target, trees[target], path=test)
+        inferred = time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    report = Profiler.report()
+    counters = report["counters"]
+    evaluated = counters.get("examplesEvaluated", 0) + counters.get("proofs", 0)
+    peakMemory = report["peakMemory"]
+    return {
+        "domain": domain,
+        "facts": facts,
+        "vectorized": vectorized,
+        "generate": generated,
+        "learn": learned,
+        "infer": inferred,
+        "tree": report["timers"].get("tree", {}).get("mean"),
+        "gradients": report["timers"].get("gradients", {}).get("mean"),
+        "proofs": evaluated,
+        "proofsPerSecond": evaluated / (learned + inferred),
+        "peakMemory": peakMemory["self"] if peakMemory else None,
+        "counters": counters,
+    }
+
+
+def run(domain, facts, trees, seed, keep=False, vectorized=False):
+    """
+    Runs :func:`runOne` in a new Python process, so that its peak memory is
+    measured on its own.
+    """
+    directory = tempfile.mkdtemp(prefix="rfgb-benchmark-")
+    try:
+        output = subprocess.check_output(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--run",
+                domain,
+                str(facts),
+                str(trees),
+                str(seed),
+                directory,
+                str(int(vectorized)),
+            ]
+        )
+    finally:
+        if keep:
+            print("Kept", directory)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+    return json.loads(output.decode("utf-8").splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints how results compare with the baseline, and returns the number of
+    regressions.
+    """
+    base = dict(((b["domain"], b["facts"]), b) for b in baseline)
+    regressions = 0
+    for result in results:
+        old = base.get((result["domain"], result["facts"]))
+        if old is None:
+            continue
+        for metric in METRICS:
+            if not old.get(metric) or result.get(metric) is None:
+                continue
+            ratio = result[metric] / old[metric]
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(
+                "%-12s %9d  %-10s %10.4g -> %10.4g  (x%.2f)%s"
+                % (
+                    result["domain"],
+                    result["facts"],
+                    metric,
+                    old[metric],
+                    result[metric],
+                    ratio,
+                    flag,
+                )
+            )
+    return regressions
+
+
+def compareVectorized(results, vectorized):
+    """
+    Prints the times of learning with and without vectorized.
+    """
+    print(
+        "%-12s %9s %10s %10s %12s %12s %9s"
+        % ("domain", "facts", "learn", "vec learn", "gradients", "vec grads", "speedup")
+    )
+    for result, vector in zip(results, vectorized):
+        print(
+            "%-12s %9d %10.3f %10.3f %12.4f %12.4f %8.2fx"
+            % (
+                result["domain"],
+                result["facts"],
+                result["learn"],
+                vector["learn"],
+                result["gradients"] or 0.0,
+                vector["gradients"] or 0.0,
+                result["learn"] / vector["learn"],
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--domain",
+        action="append",
+        choices=sorted(GENERATORS),
+        help="Domain(s) to run (Default: all).",
+    )
+    parser.add_argument(
+        "--facts",
+        type=int,
+        action="append",
+        help="Number(s) of training facts (Default: 1000 and 10000).",
+    )
+    parser.add_argument("--trees", type=int, default=3, help="Trees to learn.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    parser.add_argument("--save", help="Save the results to this file.")
+    parser.add_argument("--baseline", help="Compare with the results in this file.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Slowdown over the baseline reported as a regression (Default: 0.25).",
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the generated data."
+    )
+    parser.add_argument(
+        "--vectorized",
+        action="store_true",
+        help="Also learn with vectorized=True, and compare the times.",
+    )
+    parser.add_argument("--run", nargs=6, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        domain, facts, trees, seed, directory, vectorized = args.run
+        result = runOne(
+            domain,
+            int(facts),
+            int(trees),
+            int(seed),
+            directory,
+            vectorized=vectorized == "1",
+        )
+        print(json.dumps(result))
+        return 0
+
+    print(
+        "%-12s %9s %9s %9s %9s %9s %12s %10s"
+        % ("domain", "facts", "generate", "learn", "tree", "infer", "proofs/s", "peak MB")
+    )
+    results = []
+    vectorized = []
+    for domain in args.domain or sorted(GENERATORS):
+        for facts in args.facts or [1000, 10000]:
+            result = run(domain, facts, args.trees, args.seed, args.keep)
+            results.append(result)
+            if args.vectorized:
+                vectorized.append(
+                    run(domain, facts, args.trees, args.seed, vectorized=True)
+                )
+            print(
+                "%-12s %9d %9.3f %9.3f %9.3f %9.3f %12.1f %10.1f"
+                % (
+                    domain,
+                    facts,
+                    result["generate"],
+                    result["learn"],
+                    result["tree"] or 0.0,
+                    result["infer"],
+                    result["proofsPerSecond"],
+                    (result["peakMemory"] or 0) / 2 ** 20,
+                )
+            )
+
+    if args.vectorized:
+        print()
+        compareVectorized(results, vectorized)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print()
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
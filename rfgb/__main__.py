@@ -29,6 +29,8 @@ from __future__ import unicode_literals
 
 from .boosting import updateGradients
 from .boosting import performInference
+from .cmd.generate import GENERATORS
+from .profiling import Profiler
 from .tree import node
 from .utils import Utils
 from ._metadata import __version__
@@ -92,6 +94,15 @@ INFER_PARSER = SUBPARSERS.add_parser(
     help="Infer with various SRL models.",
 )
 
+GENERATE_PARSER = SUBPARSERS.add_parser(
+    "generate",
+    description=(
+        "Generate a synthetic dataset (facts.txt, pos.txt, neg.txt and bk.txt)\n"
+        "for one of the test domains, streaming it to disk."
+    ),
+    help="Generate synthetic datasets.",
+)
+
 # Sub-commands specific to learning different models.
 LEARN_SUBPARSER = LEARN_PARSER.add_subparsers(
     title="RFGB Learn",
@@ -130,8 +141,47 @@ INFER_PARSER.add_argument(
 INFER_PARSER.add_argument(
     "-test", "--test", type=str, default="test/", help="Set the testing directory."
 )
+INFER_PARSER.add_argument(
+    "-profile",
+    "--profile",
+    type=str,
+    default=None,
+    help="Write counters, timings and peak memory as JSON to this file.",
+)
 INIT_PARSER.add_argument("-q", "--quiet", help="Quiet output.", action="store_true")
 
+# generate-specific arguments
+GENERATE_PARSER.add_argument(
+    "domain", choices=sorted(GENERATORS), help="Domain to generate."
+)
+GENERATE_PARSER.add_argument(
+    "-facts",
+    "--facts",
+    type=int,
+    default=10000,
+    help="Number of facts to generate (Default: 10000)",
+)
+GENERATE_PARSER.add_argument(
+    "-density",
+    "--density",
+    type=float,
+    default=None,
+    help=(
+        "Average number of friends per person, for ToyCancer only "
+        "(Default: 3.0)"
+    ),
+)
+GENERATE_PARSER.add_argument(
+    "-seed", "--seed", type=int, default=None, help="Seed of the random generator."
+)
+GENERATE_PARSER.add_argument(
+    "-output",
+    "--output",
+    type=str,
+    default="train/",
+    help="Directory the dataset is written to (Default: train/)",
+)
+
 # RDN-specific arguments.
 RDN_PARSER.add_argument(
     "-advice",
@@ -190,6 +240,93 @@ RDN_PARSER.add_argument(
 RDN_PARSER.add_argument(
     "-train", "--train", type=str, default="train/", help="Set the training directory."
 )
+RDN_PARSER.add_argument(
+    "-jobs",
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of processes used to score candidate tests (Default: 1)",
+)
+RDN_PARSER.add_argument(
+    "-parallel",
+    "--parallel-targets",
+    help=(
+        "Learn the models for different targets in parallel, using the "
+        "number of processes given by --jobs."
+    ),
+    action="store_true",
+)
+RDN_PARSER.add_argument(
+    "-max-tests",
+    "--max-tests",
+    type=int,
+    default=None,
+    help=(
+        "Maximum number of candidate tests scored at a node, nodes with more "
+        "candidates score a random sample of them (Default: all)"
+    ),
+)
+RDN_PARSER.add_argument(
+    "-sample",
+    "--sample",
+    type=float,
+    default=1.0,
+    help="Fraction of the examples each tree is learned from (Default: 1.0)",
+)
+RDN_PARSER.add_argument(
+    "-neg-pos-ratio",
+    "--neg-pos-ratio",
+    type=float,
+    default=None,
+    help=(
+        "Maximum number of negatives per positive each tree is learned from "
+        "(Default: all)"
+    ),
+)
+RDN_PARSER.add_argument(
+    "-gradient-sampling",
+    "--gradient-sampling",
+    help=(
+        "Sample the examples each tree is learned from with a probability "
+        "proportional to the magnitude of their gradient."
+    ),
+    action="store_true",
+)
+RDN_PARSER.add_argument(
+    "-vectorized",
+    "--vectorized",
+    help=(
+        "Store the gradients of the examples in NumPy arrays and update them "
+        "all at once (requires NumPy)."
+    ),
+    action="store_true",
+)
+RDN_PARSER.add_argument(
+    "-coverage-cache",
+    "--coverage-cache",
+    type=float,
+    default=None,
+    help=(
+        "Megabytes used to remember the examples covered by clauses across "
+        "trees, 0 disables it (Default: 128)"
+    ),
+)
+RDN_PARSER.add_argument(
+    "-resume",
+    "--resume",
+    help=(
+        "Continue boosting from the trees saved in .rfgb/models/ for each "
+        "target, up to --trees trees in total."
+    ),
+    action="store_true",
+)
+RDN_PARSER.add_argument(
+    "-profile",
+    "--profile",
+    type=str,
+    default=None,
+    help="Write counters, timings and peak memory as JSON to this file.",
+)
 
 # Get the arguments
 PARAMETERS = PARSER.parse_args()
@@ -198,6 +335,15 @@ if PARAMETERS._rfgb == "init":
     # Initialize an empty rfgb repository for loading and saving models.
     cmd.init(quiet=PARAMETERS.quiet)
 
+elif PARAMETERS._rfgb == "generate":
+    cmd.generate(
+        PARAMETERS.domain,
+        PARAMETERS.output,
+        PARAMETERS.facts,
+        seed=PARAMETERS.seed,
+        density=PARAMETERS.density,
+    )
+
 elif PARAMETERS._rfgb == "help":
     print("Help information.")
 
@@ -209,16 +355,44 @@ elif PARAMETERS._rfgb == "learn":
         if not PARAMETERS.target:
             raise (ValueError("'target' must be provided."))
 
+        WARM_START = {}
+        if PARAMETERS.resume:
+            for target in PARAMETERS.target:
+                if os.path.exists(".rfgb/models/" + target + ".json"):
+                    WARM_START[target] = Utils.load(
+                        ".rfgb/models/" + target + ".json"
+                    )
+
+        if PARAMETERS.profile:
+            Profiler.enable()
+
+        COVERAGE_CACHE_SIZE = None
+        if PARAMETERS.coverage_cache is not None:
+            COVERAGE_CACHE_SIZE = int(PARAMETERS.coverage_cache * 2 ** 20)
+
         TREES = rdn.learn(
             PARAMETERS.target,
+            numTrees=PARAMETERS.trees,
             path=PARAMETERS.train,
             regression=PARAMETERS.regression,
             advice=PARAMETERS.advice,
             softm=PARAMETERS.softm,
             alpha=PARAMETERS.alpha,
             beta=PARAMETERS.beta,
+            n_jobs=PARAMETERS.jobs,
+            parallelTargets=PARAMETERS.parallel_targets,
+            maxTests=PARAMETERS.max_tests,
+            sampleFraction=PARAMETERS.sample,
+            negPosRatio=PARAMETERS.neg_pos_ratio,
+            gradientSampling=PARAMETERS.gradient_sampling,
+            warm_start=WARM_START,
+            vectorized=PARAMETERS.vectorized,
+            coverageCacheSize=COVERAGE_CACHE_SIZE,
         )
 
+        if PARAMETERS.profile:
+            Profiler.save(PARAMETERS.profile)
+
     elif PARAMETERS._learn == "mln":
         print("Learning MLN (TODO)")
         exit(1)
@@ -241,6 +415,9 @@ elif PARAMETERS._rfgb == "infer":
             map(lambda s: s.replace(".json", ""), os.listdir(".rfgb/models/"))
         )
 
+    if PARAMETERS.profile:
+        Profiler.enable()
+
     for target in TARGETS:
 
         model = Utils.load(".rfgb/models/" + target + ".json")
@@ -253,6 +430,9 @@ elif PARAMETERS._rfgb == "infer":
         # Print results for easy viewing.
         print(results)
 
+    if PARAMETERS.profile:
+        Profiler.save(PARAMETERS.profile)
+
     exit(0)
 
 else:
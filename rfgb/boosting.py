@@ -26,12 +26,22 @@ Documentation
 
 from __future__ import division
 
+from .utils import ArrayView
 from .utils import Utils
+from .compiler import CompiledModel
+from .logic import Logic
 from .logic import Prover
 
 from math import log
 from math import exp
-from copy import deepcopy
+
+import heapq
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 _log_prior = -1.8
 
@@ -70,21 +80,49 @@ def computeSumOfGradients(example, trees, data):
     :type data:
     """
 
-    sumOfGradients = 0
+    return computeSumsOfGradients([example], trees, data)[example]
+
+
+def computeSumsOfGradients(examples, trees, data):
+    """
+    Computes new gradients for a list of examples at once, with one
+    :meth:`.Logic.coverage` call per clause rather than one proof per example.
+
+    The trees are compiled into a :py:class:`.compiler.CompiledModel` first,
+    so tests shared by several trees are only proved once per example.
+
+    :param examples: Examples to compute the sum of gradients for.
+    :type examples: list of str.
+
+    :param trees: List of learned trees.
+    :type trees: list.
+
+    :param data: Data containing the facts.
+    :type data: :py:class:`.utils.Data` object.
 
-    # Add leaf values satisfied by example in each tree.
+    :returns: Dictionary mapping each example to its sum of gradients.
+    :rtype: dict.
+    """
+
+    if trees and all(isinstance(tree, dict) for tree in trees):
+        return CompiledModel(trees).sumsOfGradients(examples, data)
+
+    sumsOfGradients = dict((example, 0) for example in examples)
+
+    # Add leaf values satisfied by examples in each tree.
     for tree in trees:
-        gradient = inferTreeValue(tree, example, data)
-        sumOfGradients += gradient
-    return sumOfGradients
+        values = inferTreeValues(tree, examples, data)
+        for example in examples:
+            sumsOfGradients[example] += values[example]
+    return sumsOfGradients
 
 
-def inferTreeValue(clauses, query, data):
+def inferTreeValue(tree, query, data):
     """
-    Returns the probability of `query` given data and the clauses learned.
+    Returns the probability of `query` given data and the tree learned.
 
-    :param clauses:
-    :type clauses:
+    :param tree:
+    :type tree:
 
     :param query:
     :type query:
@@ -92,17 +130,97 @@ def inferTreeValue(clauses, query, data):
     :param data:
     :type data:
     """
+    return inferTreeValues(tree, [query], data)[query]
+
+
+def inferTreeValues(tree, queries, data):
+    """
+    Returns a dictionary mapping each query to the value of the leaf of tree
+    it reaches.
+
+    Each query goes down the tree from the root, and the test at each node
+    on its way is proved once, for all the queries at that node together.
+    Queries reaching a branch no example reached during learning are given
+    the value of the node above it.
+
+    Trees saved as lists of clauses (most specific first) by earlier versions
+    are also accepted, in which case each query is given the value of the
+    first clause it satisfies (or None if it satisfies none of them).
+
+    :param tree: A learned tree (see :meth:`.node.learnTree`).
+    :type tree: dict.
+
+    :param queries: Examples to find the values of.
+    :type queries: list of str.
+
+    :param data: Data containing the facts.
+    :type data: :py:class:`.utils.Data` object.
+    """
+    if not isinstance(tree, dict):
+        return _inferClauseValues(tree, queries, data)
+
+    values = dict((query, None) for query in queries)
+
+    # Nodes to visit, with the tests of their ancestors on the true side and
+    # the queries which reached them.
+    stack = [(tree, [], list(values))]
+    while stack:
+        subtree, tests, reached = stack.pop()
+        if "test" not in subtree:
+            for query in reached:
+                values[query] = subtree["value"]
+            continue
+
+        body = tests + [subtree["test"]]
+        clause = tree["head"] + ":-" + ",".join(body)
+        satisfied = set(Logic.coverage(data, clause, reached))
+        branches = [
+            ("true", body, [query for query in reached if query in satisfied]),
+            ("false", tests, [query for query in reached if query not in satisfied]),
+        ]
+        for branch, branchTests, branchQueries in branches:
+            if not branchQueries:
+                continue
+            if branch in subtree:
+                stack.append((subtree[branch], branchTests, branchQueries))
+            else:
+                for query in branchQueries:
+                    values[query] = subtree["value"]
+
+    return values
+
+
+def _inferClauseValues(clauses, queries, data):
+    """
+    Returns a dictionary mapping each query to the value of the first clause
+    it satisfies (or None if it satisfies none of them).
+
+    :param clauses: Clauses of a learned tree, most specific first.
+    :type clauses: list of str.
+    """
+    values = dict((query, None) for query in queries)
+    remaining = list(values)
+
     for clause in clauses:
+        if not remaining:
+            break
 
-        clauseCopy = deepcopy(clause)
-        clauseValue = float(clauseCopy.split(" ")[1])
-        clauseRule = clauseCopy.split(" ")[0].replace(";", ",")
+        clauseValue = float(clause.split(" ")[1])
+        clauseRule = clause.split(" ")[0].replace(";", ",")
 
         if not clauseRule.split(":-")[1]:
-            return clauseValue
-        if Prover.prove(data, query, clauseRule):
-            # Check if query satisifes clause
-            return clauseValue
+            satisfied = remaining
+        else:
+            # Check which queries satisfy the clause
+            satisfied = Logic.coverage(data, clauseRule, remaining)
+
+        for query in satisfied:
+            values[query] = clauseValue
+        if satisfied:
+            satisfied = set(satisfied)
+            remaining = [query for query in remaining if query not in satisfied]
+
+    return values
 
 
 def performInference(testData, trees):
@@ -123,6 +241,9 @@ def performInference(testData, trees):
 
     """
 
+    # Compute the sum of gradients for every test example at once.
+    sumsOfGradients = computeSumsOfGradients(testData.getExamples(), trees, testData)
+
     logPrior = _log_prior
     if not testData.regression:
 
@@ -131,7 +252,7 @@ def performInference(testData, trees):
         for example in testData.pos:
 
             # Compute sum of gradients
-            sumOfGradients = computeSumOfGradients(example, trees, testData)
+            sumOfGradients = sumsOfGradients[example]
 
             # Calculate probability as sigmoid(log odds)
             testData.pos[example] = Utils.sigmoid(logPrior + sumOfGradients)
@@ -139,7 +260,7 @@ def performInference(testData, trees):
         for example in testData.neg:
 
             # Compute sum of gradients
-            sumOfGradients = computeSumOfGradients(example, trees, testData)
+            sumOfGradients = sumsOfGradients[example]
 
             # Calculate probability as sigmoid(log odds)
             testData.neg[example] = Utils.sigmoid(logPrior + sumOfGradients)
@@ -147,11 +268,191 @@ def performInference(testData, trees):
     elif testData.regression:
         logPrior = 0.0
         for example in testData.examples:
-            sumOfGradients = computeSumOfGradients(example, trees, testData)
+            sumOfGradients = sumsOfGradients[example]
             testData.examples[example] = sumOfGradients
 
 
-def updateGradients(data, trees, loss="LS", delta=None):
+def sampleExamples(data, fraction=1.0, negPosRatio=None, byGradient=False):
+    """
+    Returns a sample of the examples of data to learn a tree from, in the
+    order of :meth:`.Data.getExamples`.
+
+    Positives and negatives are sampled separately. With negPosRatio, at
+    most negPosRatio negatives per positive are kept, and then a fraction
+    of the examples of each kind is kept (at least one, if there are any).
+
+    :param data: Data with the examples and their gradients.
+    :type data: :py:class:`.utils.Data` object.
+
+    :param fraction: Fraction of the examples to keep.
+    :type fraction: float.
+
+    :param negPosRatio: Maximum number of negatives per positive.
+    :type negPosRatio: float.
+
+    :param byGradient: Sample examples with a probability proportional to
+                       the magnitude of their gradient instead of uniformly,
+                       so that examples which are already predicted well are
+                       left out more often.
+    :type byGradient: bool.
+
+    Example:
+
+    .. code-block:: python
+
+                    from rfgb.boosting import sampleExamples
+
+                    # All the positives and as many negatives.
+                    examples = sampleExamples(data, negPosRatio=1.0)
+                    node.learnTree(data, examples)
+    """
+
+    def sample(examples, size):
+        size = max(min(size, len(examples)), min(len(examples), 1))
+        if size == len(examples):
+            return examples
+        if not byGradient:
+            return random.sample(examples, size)
+        # Weighted sampling without replacement: keep the examples with the
+        # largest u ** (1 / weight), for u uniform in [0, 1).
+        keys = []
+        for example in examples:
+            weight = abs(data.getValue(example))
+            key = random.random() ** (1.0 / weight) if weight else 0.0
+            keys.append((key, example))
+        return [example for _, example in heapq.nlargest(size, keys)]
+
+    if data.regression:
+        groups = [list(data.examples)]
+    else:
+        pos, neg = list(data.pos), list(data.neg)
+        if negPosRatio is not None:
+            neg = sample(neg, int(round(negPosRatio * len(pos))))
+        groups = [pos, neg]
+
+    sampled = set()
+    for group in groups:
+        sampled.update(sample(group, int(round(fraction * len(group)))))
+    return [example for example in data.getExamples() if example in sampled]
+
+
+def _updateGradientArrays(data, sumsOfGradients, loss="LS", delta=None):
+    """
+    :func:`updateGradients` for data whose examples are stored in arrays (see
+    :meth:`.Data.useArrays`), computing every gradient at once.
+    """
+    arrays = data.arrays
+    scores = arrays.gather(sumsOfGradients)
+
+    if data.regression:
+        gradients = arrays.trueValues - scores
+        if loss == "LAD":
+            gradients = numpy.sign(gradients)
+        elif loss == "Huber":
+            gradients = numpy.where(
+                gradients > float(delta), numpy.sign(gradients), gradients
+            )
+        elif loss != "LS":
+            return
+        arrays.values[:] = gradients
+        return
+
+    exps = numpy.exp(_log_prior + scores)
+    probabilities = exps / (1 + exps)
+    if data.softm:
+        # exp(alpha) for the positives and exp(-beta) for the negatives.
+        weights = numpy.where(arrays.labels == 1, exp(data.alpha), exp(-data.beta))
+        gradients = 1 - probabilities / (
+            probabilities + (1 - probabilities) * weights
+        )
+    else:
+        gradients = arrays.labels - probabilities
+        if data.advice:
+            gradients += [computeAdviceGradient(e) for e in arrays.examples]
+    arrays.values[:] = gradients
+
+
+def _updateSumArrays(sums, tree, data, leafValues):
+    """
+    :func:`updateSumsOfGradients` for sums stored in an array of the
+    :py:class:`.ExampleArrays` of data, adding the values of the leaves to
+    all of them at once.
+    """
+    arrays = data.arrays
+    if leafValues:
+        sums[arrays.positions(leafValues)] += numpy.fromiter(
+            leafValues.values(), dtype=float, count=len(leafValues)
+        )
+    if len(leafValues) == len(arrays.examples):
+        return
+
+    remaining = [example for example in arrays.examples if example not in leafValues]
+    values = inferTreeValues(tree, remaining, data)
+    sums[arrays.positions(remaining)] += numpy.fromiter(
+        (values[example] for example in remaining), dtype=float, count=len(remaining)
+    )
+
+
+def updateSumsOfGradients(sumsOfGradients, tree, data, leafValues=None):
+    """
+    Adds the values a newly learned tree gives to each example to a running
+    sum of gradients, so that trees learned earlier are never inferred again.
+    Examples whose leaf is already known (see :attr:`.node.leafValues`) are
+    not inferred either.
+
+    :param sumsOfGradients: Dictionary mapping examples to the sum of
+                            gradients of the trees learned before this one
+                            (updated in place).
+    :type sumsOfGradients: dict.
+
+    :param tree: The newly learned tree.
+    :type tree: list of str.
+
+    :param data: Data containing the facts.
+    :type data: :py:class:`.utils.Data` object.
+
+    :param leafValues: Dictionary mapping examples to the value of the leaf
+                       they ended up in while the tree was learned.
+    :type leafValues: dict.
+
+    Example:
+
+    .. code-block:: python
+
+                    from rfgb.boosting import updateSumsOfGradients
+
+                    sumsOfGradients = dict.fromkeys(data.getExamples(), 0)
+                    trees = []
+                    for i in range(numTrees):
+                        node.learnTree(data)
+                        trees.append(node.learnedDecisionTree)
+                        updateSumsOfGradients(sumsOfGradients, trees[-1], data,
+                                              node.leafValues)
+                        updateGradients(data, trees,
+                                        sumsOfGradients=sumsOfGradients)
+    """
+    if leafValues is None:
+        leafValues = {}
+
+    arrays = data.arrays
+    if (
+        isinstance(sumsOfGradients, ArrayView)
+        and sumsOfGradients.arrays is arrays
+        and sumsOfGradients.full
+    ):
+        _updateSumArrays(sumsOfGradients.array, tree, data, leafValues)
+        return
+
+    remaining = [example for example in sumsOfGradients if example not in leafValues]
+    values = inferTreeValues(tree, remaining, data)
+    for example in sumsOfGradients:
+        if example in leafValues:
+            sumsOfGradients[example] += leafValues[example]
+        else:
+            sumsOfGradients[example] += values[example]
+
+
+def updateGradients(data, trees, loss="LS", delta=None, sumsOfGradients=None):
     """
     Update gradients of the data.
 
@@ -161,6 +462,12 @@ def updateGradients(data, trees, loss="LS", delta=None):
     :param trees: List of strings representing trees.
     :type trees: list.
 
+    :param sumsOfGradients: Sum of gradients of the trees for each example,
+                            when it is already known (see
+                            :func:`updateSumsOfGradients`). Computed from
+                            the trees otherwise.
+    :type sumsOfGradients: dict.
+
     :param loss: Loss function for regression (currently implemented:
                  'LS', 'LAD', 'Huber').
     :type loss: str.
@@ -176,11 +483,19 @@ def updateGradients(data, trees, loss="LS", delta=None):
 
     """
 
+    # Compute the sum of gradients for every example at once.
+    if sumsOfGradients is None:
+        sumsOfGradients = computeSumsOfGradients(data.getExamples(), trees, data)
+
+    if data.arrays is not None:
+        _updateGradientArrays(data, sumsOfGradients, loss, delta)
+        return
+
     if data.regression:
         # If this is regression data, compute gradient as y - y_hat
 
         for example in data.examples:
-            sumOfGradients = computeSumOfGradients(example, trees, data)
+            sumOfGradients = sumsOfGradients[example]
             trueValue = data.getExampleTrueValue(example)
 
             if loss == "LS":
@@ -242,14 +557,14 @@ def updateGradients(data, trees, loss="LS", delta=None):
 
             for example in data.pos:
 
-                sumOfGradients = computeSumOfGradients(example, trees, data)
+                sumOfGradients = sumsOfGradients[example]
                 prob = Utils.sigmoid(logPrior + sumOfGradients)
                 updatedGradient = 1 - prob / (prob + (1 - prob) * exp(data.alpha))
                 data.pos[example] = updatedGradient
 
             for example in data.neg:
 
-                sumOfGradients = computeSumOfGradients(example, trees, data)
+                sumOfGradients = sumsOfGradients[example]
                 prob = Utils.sigmoid(logPrior + sumOfGradients)
                 updatedGradient = 1 - prob / (prob + (1 - prob) * exp(-data.beta))
                 data.neg[example] = updatedGradient
@@ -258,7 +573,7 @@ def updateGradients(data, trees, loss="LS", delta=None):
 
             for example in data.pos:
 
-                sumOfGradients = computeSumOfGradients(example, trees, data)
+                sumOfGradients = sumsOfGradients[example]
                 prob = Utils.sigmoid(logPrior + sumOfGradients)
                 updatedGradient = 1 - prob
 
@@ -269,7 +584,7 @@ def updateGradients(data, trees, loss="LS", delta=None):
 
             for example in data.neg:
 
-                sumOfGradients = computeSumOfGradients(example, trees, data)
+                sumOfGradients = sumsOfGradients[example]
                 prob = Utils.sigmoid(logPrior + sumOfGradients)
                 updatedGradient = 0 - prob
 
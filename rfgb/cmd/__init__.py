@@ -16,4 +16,5 @@
 # along with this program (at the base of this repository). If not,
 # see <http://www.gnu.org/licenses/>
 
+from .generate import generate
 from .init import init
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017-2019 rfgb Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (at the base of this repository). If not,
+# see <http://www.gnu.org/licenses/>
+
+"""
+Generates synthetic versions of the domains in ``testDomains/`` with a given
+number of facts.
+
+The Logistics, MoodDisorder and BlocksWorld generators follow the scripts
+shipped with those domains, and ToyCancer is a random social network where
+smokers and friends of smokers tend to have cancer. Lines are written to
+disk as they are generated, so millions of facts can be generated without
+holding them in memory.
+
+.. code-block:: python
+
+                from rfgb.cmd import generate
+
+                generate("Logistics", "train/", facts=1000000, seed=1)
+
+.. code-block:: bash
+
+                $ rfgb generate Logistics --facts 1000000 --seed 1 --output train/
+"""
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import os
+import random
+
+# Modes of each domain, as in testDomains/<domain>/train/bk.txt
+BACKGROUND = {
+    "BlocksWorld": [
+        "putdown(state)",
+        "ontable(+state,+block,[table])",
+        "on(+state,-block,+block)",
+    ],
+    "Logistics": [
+        "unload(state,truck)",
+        "bon(+state,+box,+truck)",
+        "tin(+state,+truck,+city)",
+        "isd(+state,+city)",
+        "dname(+state,+city,[c1;c2;c3])",
+    ],
+    "MoodDisorder": [
+        "bipolar(person)",
+        "dep(+person)",
+        "agg(+person)",
+        "anxiety(+person)",
+        "abuse(+person)",
+        "heartrate(+person)",
+        "breathing(+person)",
+        "pattern(+person)",
+        "ego(+person)",
+    ],
+    "ToyCancer": [
+        "friends(+person,-person)",
+        "friends(-person,+person)",
+        "smokes(+person)",
+        "cancer(person)",
+    ],
+}
+
+# Target predicate of each domain.
+TARGETS = {
+    "BlocksWorld": "putdown",
+    "Logistics": "unload",
+    "MoodDisorder": "bipolar",
+    "ToyCancer": "cancer",
+}
+
+
+def blocksWorld(facts, rng, density=None):
+    """
+    Yields ``(file, line)`` pairs for states with two to four stacked
+    blocks, where states with three or more blocks are positive.
+    """
+    written = 0
+    number = 0
+    while written < facts:
+        state = "s" + str(number)
+        blocks = 2
+        if rng.random() < 0.5:
+            blocks = 3 if rng.random() < 0.5 else 4
+        yield "facts", "ontable(" + state + ",b1,table)"
+        for block in range(2, blocks + 1):
+            yield "facts", "on(%s,b%d,b%d)" % (state, block, block - 1)
+        yield ("pos" if blocks >= 3 else "neg"), "putdown(" + state + ")"
+        written += blocks
+        number += 1
+
+
+def logistics(facts, rng, density=None):
+    """
+    Yields ``(file, line)`` pairs for states with a box on a truck, where
+    the truck should be unloaded if it is in its destination city.
+    """
+    written = 0
+    number = 0
+    while written < facts:
+        state = "s" + str(number)
+        if rng.random() < 0.5:
+            city = "d1" if rng.random() < 0.5 else "d2"
+            lines = [
+                "bon(%s,b,t)" % state,
+                "tin(%s,t,%s)" % (state, city),
+                "isd(%s,%s)" % (state, city),
+                "dname(%s,%s,c%s)" % (state, city, city[1]),
+            ]
+            label = "pos"
+        else:
+            lines = [
+                "bon(%s,b,t)" % state,
+                "tin(%s,t,d3)" % state,
+                "dname(%s,d3,c3)" % state,
+            ]
+            label = "neg"
+        for line in lines:
+            yield "facts", line
+        yield label, "unload(%s,t)" % state
+        written += len(lines)
+        number += 1
+
+
+def moodDisorder(facts, rng, density=None):
+    """
+    Yields ``(file, line)`` pairs for persons with symptoms of a mood
+    disorder, labeled at random as in the original generator.
+    """
+    symptoms = ["dep", "agg", "anxiety", "abuse", "heartrate", "breathing"]
+    written = 0
+    number = 0
+    while written < facts:
+        person = "p" + str(number)
+        predicates = symptoms
+        if rng.random() < 0.5:
+            predicates = symptoms + ["pattern", "ego"]
+        for predicate in predicates:
+            yield "facts", "%s(%s)" % (predicate, person)
+        yield ("pos" if rng.random() < 0.5 else "neg"), "bipolar(" + person + ")"
+        written += len(predicates)
+        number += 1
+
+
+def toyCancer(facts, rng, density=None):
+    """
+    Yields ``(file, line)`` pairs for a social network where each person
+    has density friends on average (3 by default). Smokers and friends of
+    smokers are more likely to have cancer.
+    """
+    if density is None:
+        density = 3.0
+    smokes = 0.3
+    persons = max(2, int(facts / (density + smokes)))
+    smokers = set()
+
+    for number in range(persons):
+        if rng.random() < smokes:
+            smokers.add(number)
+            yield "facts", "smokes(p%d)" % number
+
+    for number in range(persons):
+        friends = set()
+        for _ in range(int(density) + (rng.random() < density % 1)):
+            friend = rng.randrange(persons)
+            if friend != number and friend not in friends:
+                friends.add(friend)
+                yield "facts", "friends(p%d,p%d)" % (number, friend)
+
+        if number in smokers:
+            probability = 0.9
+        elif friends & smokers:
+            probability = 0.5
+        else:
+            probability = 0.1
+        label = "pos" if rng.random() < probability else "neg"
+        yield label, "cancer(p%d)" % number
+
+
+GENERATORS = {
+    "BlocksWorld": blocksWorld,
+    "Logistics": logistics,
+    "MoodDisorder": moodDisorder,
+    "ToyCancer": toyCancer,
+}
+
+# Domains whose generator takes a density.
+DENSITY = ["ToyCancer"]
+
+
+def generate(domain, path, facts, seed=None, density=None):
+    """
+    Writes facts.txt, pos.txt, neg.txt and bk.txt for a domain with about
+    the given number of facts to the directory path.
+
+    :param domain: One of the keys of GENERATORS.
+    :type domain: str.
+
+    :param path: Directory to write to (created if needed).
+    :type path: str.
+
+    :param facts: Number of facts to generate.
+    :type facts: int.
+
+    :param seed: Seed of the random number generator.
+    :type seed: int.
+
+    :param density: Average number of friends per person (ToyCancer only).
+    :type density: float.
+
+    :raises ValueError: If the domain is unknown, or a density is given for
+                        a domain which does not take one.
+    """
+    if domain not in GENERATORS:
+        raise ValueError(
+            "Unknown domain '%s', expected one of: %s"
+            % (domain, ", ".join(sorted(GENERATORS)))
+        )
+    if density is not None and domain not in DENSITY:
+        raise ValueError(
+            "The %s generator does not take a density (only: %s)."
+            % (domain, ", ".join(DENSITY))
+        )
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    with open(os.path.join(path, "bk.txt"), "w") as f:
+        for line in BACKGROUND[domain]:
+            f.write(line + "\n")
+
+    rng = random.Random(seed)
+    files = {}
+    try:
+        for name in ("facts", "pos", "neg"):
+            files[name] = open(os.path.join(path, name + ".txt"), "w")
+        for name, line in GENERATORS[domain](facts, rng, density):
+            files[name].write(line + "\n")
+    finally:
+        for f in files.values():
+            f.close()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017-2019 rfgb Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (at the base of this repository). If not,
+# see <http://www.gnu.org/licenses/>
+
+"""
+Compiles the trees of a model into one graph of the tests they share, so
+that inference proves each distinct test once per example however many
+trees use it.
+
+.. code-block:: python
+
+                from rfgb.compiler import CompiledModel
+
+                model = CompiledModel(trees)
+                sumsOfGradients = model.sumsOfGradients(data.getExamples(), data)
+"""
+
+from __future__ import division
+
+from .logic import CoverageCache
+from .logic import Logic
+from .profiling import Profiler
+
+
+class CompiledModel(object):
+    """
+    The trees of a model (see :meth:`.node.learnTree`), with their nodes
+    merged by test.
+
+    The test of a node is proved together with the tests of its ancestors on
+    the ``'true'`` side, so two nodes whose conjunctions are the same (up to
+    the names of their variables) give every example the same answer, in
+    whichever trees and at whichever depths they are. Such nodes share one
+    entry of :attr:`.CompiledModel.clauses`, which is proved once per example
+    and whose answer goes to every node that uses it.
+
+    :param clauses: Distinct clauses proved by the nodes of the trees.
+    :param roots: Root of each tree, as a compiled node.
+
+    Compiled nodes are tuples ``(clause, true, false, value)``, where clause
+    is an index in clauses (None for leaves), true and false are compiled
+    nodes (None for missing branches) and value is the value of the node.
+    """
+
+    def __init__(self, trees):
+        """
+        :param trees: Trees learned for a target.
+        :type trees: list of dict.
+        """
+        self.clauses = []
+        self._index = {}
+        self.roots = [self._compile(tree, tree["head"], []) for tree in trees]
+
+    def _compile(self, tree, head, tests):
+        """
+        Returns the compiled node of tree, given the tests of its ancestors
+        on the true side.
+        """
+        if "test" not in tree:
+            return (None, None, None, tree["value"])
+
+        body = tests + [tree["test"]]
+        clause = head + ":-" + ",".join(body)
+        key = CoverageCache.canonical(clause)
+        if key not in self._index:
+            self._index[key] = len(self.clauses)
+            self.clauses.append(clause)
+
+        true = false = None
+        if "true" in tree:
+            true = self._compile(tree["true"], head, body)
+        if "false" in tree:
+            false = self._compile(tree["false"], head, tests)
+        return (self._index[key], true, false, tree["value"])
+
+    def sumsOfGradients(self, examples, data):
+        """
+        Returns a dictionary mapping each example to the sum of the values
+        the trees give it.
+
+        All the trees are walked together, one level at a time. At each
+        level, the examples at every node using a clause are proved against
+        it at once, leaving out the examples it was already proved on.
+
+        :param examples: Examples to compute the sum of gradients for.
+        :type examples: list of str.
+
+        :param data: Data containing the facts.
+        :type data: :py:class:`.utils.Data` object.
+        """
+        sums = dict((example, 0) for example in examples)
+        # Examples each clause was proved on, and those which satisfy it.
+        proved = [set() for _ in self.clauses]
+        covered = [set() for _ in self.clauses]
+        # Value each tree gives each example, added up in the order of the
+        # trees at the end (as they would be one tree at a time).
+        values = [{} for _ in self.roots]
+
+        # Nodes at the current level, with their tree and the examples which
+        # reached them.
+        level = [(i, root, list(sums)) for i, root in enumerate(self.roots)]
+        while level:
+            # Prove each clause on the examples of this level not proved yet.
+            pending = {}
+            for _, (clause, _, _, _), reached in level:
+                if clause is not None:
+                    pending.setdefault(clause, set()).update(reached)
+            for clause, reached in pending.items():
+                missing = [e for e in reached if e not in proved[clause]]
+                if not missing:
+                    continue
+                Profiler.count("examplesEvaluated", len(missing))
+                covered[clause].update(
+                    Logic.evaluate(data, self.clauses[clause], missing)
+                )
+                proved[clause].update(missing)
+
+            below = []
+            for i, (clause, true, false, value), reached in level:
+                if clause is None:
+                    values[i].update(dict.fromkeys(reached, value))
+                    continue
+
+                satisfied = covered[clause]
+                for branch, branchExamples in (
+                    (true, [e for e in reached if e in satisfied]),
+                    (false, [e for e in reached if e not in satisfied]),
+                ):
+                    if not branchExamples:
+                        continue
+                    if branch is None:
+                        # Missing branch: the value of this node.
+                        values[i].update(dict.fromkeys(branchExamples, value))
+                    else:
+                        below.append((i, branch, branchExamples))
+            level = below
+
+        for treeValues in values:
+            for example, value in treeValues.items():
+                sums[example] += value
+        return sums
@@ -22,12 +22,13 @@
 
 from __future__ import print_function
 
-from copy import deepcopy
-from random import sample
+from collections import OrderedDict
 import itertools
 import re
 
+from .utils import ExampleIndex
 from .utils import Utils
+from .profiling import Profiler
 
 # Thanks to Chris Meyers for some of this code:
 # http://www.openbookproject.net/py4fun/prolog/prolog1.html.
@@ -65,31 +66,537 @@ class Rule(object):
                 self.goals.append(Term(fld))
 
 
+class RuleIndex(object):
+    """
+    Index over the heads of a collection of rules.
+
+    Rules are grouped by ``(predicate, arity)``, and each group keeps a hash
+    index for every argument position mapping constants to the rules whose
+    head has that constant at that position. Rules with a variable at a
+    position match any value there, so they are kept separately and returned
+    alongside the hashed candidates.
+
+    .. code-block:: python
+
+                    from rfgb.logic import Rule, RuleIndex, Term
+
+                    index = RuleIndex([Rule("friends(alice,bob)"),
+                                       Rule("friends(bob,carl)")])
+
+                    # Only friends(alice,bob) is a candidate.
+                    index.candidates(Term("friends(alice,Y)"), {})
+    """
+
+    def __init__(self, rules=None):
+        """
+        :param rules: Rules to add to the index.
+        :type rules: list of :py:class:`.logic.Rule`
+        """
+        # (pred, arity) -> all rules with that head.
+        self.rules = {}
+        # (pred, arity) -> list with one {constant: [rules]} per position.
+        self.arguments = {}
+        # (pred, arity) -> list with one [rules] per position for rules
+        # whose head has a variable at that position.
+        self.variables = {}
+
+        if rules:
+            for rule in rules:
+                self.add(rule)
+
+    def add(self, rule):
+        """
+        Add a rule to the index.
+        """
+        args = rule.head.args
+        arity = len(args)
+        key = (rule.head.pred, arity)
+
+        if key not in self.rules:
+            self.rules[key] = []
+            self.arguments[key] = [{} for _ in range(arity)]
+            self.variables[key] = [[] for _ in range(arity)]
+
+        self.rules[key].append(rule)
+        for i in range(arity):
+            if args[i] <= "Z":
+                self.variables[key][i].append(rule)
+            else:
+                self.arguments[key][i].setdefault(args[i], []).append(rule)
+
+    def remove(self, rule):
+        """
+        Remove a rule from the index. Rules are searched for from the most
+        recently added, since temporary rules are removed soon after they
+        are added.
+        """
+        args = rule.head.args
+        arity = len(args)
+        key = (rule.head.pred, arity)
+
+        RuleIndex._removeLast(self.rules[key], rule)
+        for i in range(arity):
+            if args[i] <= "Z":
+                RuleIndex._removeLast(self.variables[key][i], rule)
+            else:
+                bucket = self.arguments[key][i][args[i]]
+                RuleIndex._removeLast(bucket, rule)
+                if not bucket:
+                    del self.arguments[key][i][args[i]]
+
+    @staticmethod
+    def _removeLast(rules, rule):
+        for i in range(len(rules) - 1, -1, -1):
+            if rules[i] is rule:
+                del rules[i]
+                return
+
+    def candidates(self, term, env):
+        """
+        Returns the rules whose head may unify with term under env.
+
+        Every argument of ``term`` which is a constant (or a variable bound
+        in env) selects a hash bucket, and the smallest one is returned.
+        Candidates are not guaranteed to unify, but every rule that does
+        unify is among them.
+        """
+        args = term.args
+        key = (term.pred, len(args))
+        candidates = self.rules.get(key)
+        if not candidates:
+            return []
+
+        arguments = self.arguments[key]
+        variables = self.variables[key]
+        for i in range(len(args)):
+            arg = args[i]
+            if arg <= "Z":
+                value = env.get(arg)
+            else:
+                value = arg
+            if not value:
+                continue
+
+            bucket = arguments[i].get(value, [])
+            if variables[i]:
+                bucket = bucket + variables[i]
+            if len(bucket) < len(candidates):
+                candidates = bucket
+                if not candidates:
+                    break
+
+        return candidates
+
+
+class SymbolTable(object):
+    """
+    Interns predicate names and constants as small integers.
+
+    .. code-block:: python
+
+                    from rfgb.logic import SymbolTable
+
+                    symbols = SymbolTable()
+                    symbols.intern("alice")
+                    # 0
+                    symbols.intern("bob")
+                    # 1
+                    symbols.lookup("alice")
+                    # 0
+                    symbols.symbols[1]
+                    # 'bob'
+    """
+
+    def __init__(self):
+        # symbol -> id
+        self.ids = {}
+        # id -> symbol
+        self.symbols = []
+
+    def intern(self, symbol):
+        """
+        Returns the id of symbol, adding it to the table if it is new.
+        """
+        symbolId = self.ids.get(symbol)
+        if symbolId is None:
+            symbolId = len(self.symbols)
+            self.ids[symbol] = symbolId
+            self.symbols.append(symbol)
+        return symbolId
+
+    def lookup(self, symbol):
+        """
+        Returns the id of symbol, or None if it has never been interned.
+        """
+        return self.ids.get(symbol)
+
+
+class CoverageCache(object):
+    """
+    Least recently used cache of the examples covered by clauses.
+
+    Clauses are keyed by their canonical form (see
+    :meth:`.CoverageCache.canonical`), so clauses which only differ in the
+    names of their variables share an entry. Each entry remembers the
+    examples the clause has been evaluated on and the ones among them it
+    covers, so a clause only has to be evaluated on examples it has not been
+    evaluated on before.
+
+    Both sets of examples are kept as bitsets over an
+    :py:class:`.utils.ExampleIndex` of the examples seen by the cache. The
+    clauses scored at a node are all evaluated on the examples at the node,
+    so entries with the same evaluated examples share one bitset.
+
+    The size of the cache is the number of bytes of the bitsets stored over
+    all entries (counting shared bitsets once). Least recently used entries
+    are dropped once it exceeds maxSize.
+
+    .. code-block:: python
+
+                    from rfgb.logic import CoverageCache
+
+                    cache = CoverageCache()
+                    cache.store("cancer(A):-smokes(A)",
+                                ["cancer(alice)", "cancer(bob)"],
+                                ["cancer(alice)"])
+
+                    cache.lookup("cancer(X):-smokes(X)",
+                                 ["cancer(alice)", "cancer(carl)"])
+                    # (['cancer(alice)'], ['cancer(carl)'])
+    """
+
+    maxSize = 2 ** 27
+
+    def __init__(self, maxSize=None):
+        """
+        :param maxSize: Maximum number of bytes stored, defaults to
+                        CoverageCache.maxSize (128 MB). 0 disables the cache.
+        :type maxSize: int.
+        """
+        if maxSize is not None:
+            self.maxSize = maxSize
+        self.index = ExampleIndex()
+        # canonical clause -> (evaluated bitset, covered bitset)
+        self.entries = OrderedDict()
+        # evaluated bitset -> [the bitset shared by the entries, number of
+        # entries sharing it]
+        self.evaluated = {}
+        self.size = 0
+
+    @staticmethod
+    def canonical(clause):
+        """
+        Returns clause with its variables renamed in order of first
+        appearance and its body literals separated by ';'.
+        """
+        rule = Rule(clause)
+        names = {}
+        literals = []
+        for term in [rule.head] + rule.goals:
+            args = []
+            for arg in term.args:
+                if arg <= "Z":
+                    arg = names.setdefault(arg, "V%d" % len(names))
+                args.append(arg)
+            literals.append(term.pred + "(" + ",".join(args) + ")")
+        return literals[0] + ":-" + ";".join(literals[1:])
+
+    @staticmethod
+    def sizeOf(bits):
+        """
+        Returns the number of bytes of a bitset.
+        """
+        return (bits.bit_length() + 7) // 8
+
+    def lookup(self, clause, examples):
+        """
+        Returns the examples known to be covered by clause, and the examples
+        it has not been evaluated on yet, both in the order given.
+        """
+        key = CoverageCache.canonical(clause)
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return [], list(examples)
+        self.entries[key] = entry
+
+        evaluated, covered = entry
+        requested = self.index.bits(examples)
+        return (
+            self._select(examples, requested & covered),
+            self._select(examples, requested & ~evaluated),
+        )
+
+    def _select(self, examples, bits):
+        """
+        Returns the examples in the bitset, in the order given.
+        """
+        if not bits:
+            return []
+        members = set(self.index.members(bits))
+        if len(members) == len(examples):
+            return list(examples)
+        return [example for example in examples if example in members]
+
+    def store(self, clause, examples, covered):
+        """
+        Remember that clause covers covered, among examples.
+        """
+        if not self.maxSize:
+            return
+        key = CoverageCache.canonical(clause)
+        evaluated = self.index.bits(examples)
+        coveredBits = self.index.bits(covered)
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self._release(entry)
+            evaluated |= entry[0]
+            coveredBits |= entry[1]
+
+        entry = (self._share(evaluated), coveredBits)
+        self.size += CoverageCache.sizeOf(coveredBits)
+        entrySize = CoverageCache.sizeOf(evaluated) + CoverageCache.sizeOf(coveredBits)
+        if entrySize > self.maxSize:
+            self._release(entry)
+            return
+        self.entries[key] = entry
+
+        # Drop the least recently used entries.
+        while self.size > self.maxSize:
+            _, dropped = self.entries.popitem(last=False)
+            self._release(dropped)
+
+    def _share(self, evaluated):
+        """
+        Returns the bitset of evaluated examples shared by the entries with
+        these examples, counting one more entry sharing it.
+        """
+        shared = self.evaluated.get(evaluated)
+        if shared is None:
+            shared = self.evaluated[evaluated] = [evaluated, 0]
+            self.size += CoverageCache.sizeOf(evaluated)
+        shared[1] += 1
+        return shared[0]
+
+    def _release(self, entry):
+        """
+        Removes the size of an entry which is no longer stored.
+        """
+        evaluated, covered = entry
+        self.size -= CoverageCache.sizeOf(covered)
+        shared = self.evaluated[evaluated]
+        shared[1] -= 1
+        if not shared[1]:
+            del self.evaluated[evaluated]
+            self.size -= CoverageCache.sizeOf(evaluated)
+
+
+class KnowledgeBase(RuleIndex):
+    """
+    The facts of a :py:class:`.utils.Data` object, compiled once so that
+    every proof against the same data can share them.
+
+    Predicates and constants are interned in a :py:class:`.SymbolTable`, and
+    each ground fact is stored as a tuple of ids in the table for its
+    ``(predicate id, arity)``. Facts with variables in them, and the clause
+    being proved (which is added for the length of a proof and removed
+    afterwards, see :meth:`.Prover.prove`), are kept as rules in the
+    :py:class:`.RuleIndex` this class extends.
+
+    Since the facts do not change, the coverage of the clauses evaluated on
+    them is kept in a :py:class:`.CoverageCache` for as long as the
+    knowledge base is used.
+
+    Only the tables are interned: terms, bindings and examples are still
+    strings, and the fact strings themselves belong to the Data object (the
+    knowledge base only keeps a reference to them, to notice when they are
+    replaced).
+
+    The hash indexes built over the tables for joins are kept in least
+    recently used order, and the least recently used ones are dropped once
+    they hold more than joinIndexSize rows in total.
+    """
+
+    joinIndexSize = 10000000
+
+    def __init__(self, facts, joinIndexSize=None, coverageCacheSize=None):
+        """
+        :param facts: List of strings representing facts.
+        :type facts: list of str.
+
+        :param joinIndexSize: Maximum number of rows held by the join
+                              indexes, defaults to
+                              KnowledgeBase.joinIndexSize.
+        :type joinIndexSize: int.
+
+        :param coverageCacheSize: Maximum number of bytes held by the
+                                  coverage cache, defaults to
+                                  CoverageCache.maxSize. 0 disables it.
+        :type coverageCacheSize: int.
+        """
+        RuleIndex.__init__(self)
+        if joinIndexSize is not None:
+            self.joinIndexSize = joinIndexSize
+        self.facts = facts
+        self.symbols = SymbolTable()
+        # (pred id, arity) -> list of id tuples of the ground facts.
+        self.tables = {}
+        # (pred id, arity) of facts containing variables.
+        self.variableTables = set()
+        # (key, keyPositions, outPositions) -> hash index, least recently
+        # used first.
+        self.joinIndexes = OrderedDict()
+        # Number of rows in the join indexes.
+        self.joinIndexRows = 0
+        self.coverageCache = CoverageCache(coverageCacheSize)
+
+        intern = self.symbols.intern
+        for fact in facts:
+            term = Term(fact)
+            key = (intern(term.pred), len(term.args))
+            if any(arg <= "Z" for arg in term.args):
+                self.variableTables.add(key)
+                self.add(Rule(fact))
+            else:
+                self.tables.setdefault(key, []).append(
+                    tuple(intern(arg) for arg in term.args)
+                )
+
+    def getKey(self, term):
+        """
+        Returns the ``(predicate id, arity)`` of the table for term.
+        """
+        return (self.symbols.lookup(term.pred), len(term.args))
+
+    def getTable(self, key):
+        """
+        Returns the ground facts for ``key`` as a list of id tuples.
+        """
+        return self.tables.get(key, [])
+
+    def getJoinIndex(self, key, keyPositions, outPositions):
+        """
+        Returns a hash index over the table for ``key``, mapping the ids at
+        keyPositions to the list of id tuples at outPositions.
+        """
+        indexKey = (key, keyPositions, outPositions)
+        joinIndex = self.joinIndexes.pop(indexKey, None)
+        if joinIndex is not None:
+            self.joinIndexes[indexKey] = joinIndex
+            return joinIndex
+
+        joinIndex = {}
+        table = self.getTable(key)
+        whole = outPositions == tuple(range(key[1]))
+        for args in table:
+            joinIndex.setdefault(tuple(args[p] for p in keyPositions), []).append(
+                args if whole else tuple(args[p] for p in outPositions)
+            )
+        if len(table) > self.joinIndexSize:
+            # Used for this join only.
+            return joinIndex
+        self.joinIndexes[indexKey] = joinIndex
+        self.joinIndexRows += len(table)
+
+        # Drop the least recently used indexes.
+        while self.joinIndexRows > self.joinIndexSize:
+            (dropped, _, _), _ = self.joinIndexes.popitem(last=False)
+            self.joinIndexRows -= len(self.getTable(dropped))
+        return joinIndex
+
+    def matchFacts(self, term, env):
+        """
+        Returns the ground facts (as id tuples) which agree with every
+        constant and bound variable of term under env.
+        """
+        key = self.getKey(term)
+        if key not in self.tables:
+            return []
+
+        lookup = self.symbols.lookup
+        positions, ids = [], []
+        args = term.args
+        for i in range(len(args)):
+            arg = args[i]
+            if arg <= "Z":
+                value = env.get(arg)
+            else:
+                value = arg
+            if value:
+                symbolId = lookup(value)
+                if symbolId is None:
+                    return []
+                positions.append(i)
+                ids.append(symbolId)
+
+        joinIndex = self.getJoinIndex(key, tuple(positions), tuple(range(len(args))))
+        return joinIndex.get(tuple(ids), [])
+
+    def bindFact(self, term, fact, env):
+        """
+        Binds the unbound variables of term to the constants of a fact in env,
+        the same way :meth:`.Prover.unify` does when a fact is resolved.
+
+        :returns: List of the variables that were bound.
+        """
+        symbols = self.symbols.symbols
+        args = term.args
+        bound = []
+        for i in range(len(args)):
+            arg = args[i]
+            value = symbols[fact[i]]
+            if arg <= "Z":
+                current = env.get(arg)
+                if not current:
+                    env[arg] = value
+                    bound.append(arg)
+                elif current != value:
+                    break
+            elif arg != value:
+                break
+        return bound
+
+
 class Goal(object):
-    """class for each goal in rule during prolog search"""
+    """
+    A goal waiting to be solved during prolog search.
+
+    Goals form linked lists (each goal points to the one to solve after it),
+    which are shared by every alternative explored from them, so continuing
+    a search never copies the goals or their environments.
 
-    def __init__(self, rule, parent=None, env={}):
-        goalId = Prover.goalId
-        goalId += 1
-        self.id = goalId
-        self.rule = rule
-        self.parent = parent
-        self.env = deepcopy(env)
-        # Start search with 1st subgoal
-        self.inx = 0
+    :param term: Term to solve.
+    :param env: Environment of the rule the term belongs to.
+    :param next: Goal to solve once this one is solved (None at the end).
+    :param head: If set, this goal is the exit of a rule whose body has been
+                 solved: head (under headEnv) is unified back into term.
+    :param headEnv: Environment of the rule being exited.
+    """
+
+    def __init__(self, term, env, next=None, head=None, headEnv=None):
+        self.term = term
+        self.env = env
+        self.next = next
+        self.head = head
+        self.headEnv = headEnv
 
 
 class Prover(object):
-    """class for prolog style proof of query"""
+    """
+    Class for prolog style proof of query.
 
-    rules = []
-    goalId = 100
+    Variables are bound in place, and every binding is recorded on a trail
+    so it can be undone when the search backtracks to an earlier choice.
+    """
+
+    index = KnowledgeBase([])
     trace = 0
 
     @staticmethod
-    def unify(srcTerm, srcEnv, destTerm, destEnv):
+    def unify(srcTerm, srcEnv, destTerm, destEnv, trail=None):
         """
         Unification method.
+
+        Bindings made in destEnv are appended to trail when one is given.
         """
         nargs = len(srcTerm.args)
         if nargs != len(destTerm.args):
@@ -111,6 +618,8 @@ class Prover(object):
                     if not destVal:
                         # Unify
                         destEnv[destArg] = srcVal
+                        if trail is not None:
+                            trail.append((destEnv, destArg))
                     elif destVal != srcVal:
                         # Won't unify
                         return 0
@@ -120,104 +629,648 @@ class Prover(object):
         return 1
 
     @staticmethod
-    def search(term):
+    def search(term, count=False):
         """
         Method to perform prolog style query search.
+
+        :param term: Query to prove.
+        :type term: :py:class:`.Term`
+
+        :param count: Count the groundings of the query instead of stopping
+                      at the first proof.
+        :type count: bool
+
+        :returns: True if the query has a proof (False otherwise), or the
+                  number of groundings when count is set.
+
+        A grounding is a distinct binding of the variables of a rule whose
+        head the query is proved through, as the rows of a
+        :py:class:`.JoinEngine` join are. A ground fact matching the query
+        only counts as one grounding when no rule proves the query.
         """
-        goalId = Prover.goalId
         trace = Prover.trace
-        rules = Prover.rules
+        index = Prover.index
         unify = Prover.unify
-        goalId = 0
-        returnValue = False
+        # Groundings of the rules the query has been proved through, and
+        # whether a fact matches it.
+        groundings = set()
+        factProof = False
+        # Grounding of the last proof of the query, or None if it was
+        # proved by a fact.
+        grounding = None
+        # Goals called and unifications (including fact matches) made, for
+        # the profiler.
+        goals = 0
+        unifications = 0
         if trace:
             print("search", term)
 
-        # Anything- just get a rule object.
-        goal = Goal(Rule("got(goal):-x(y)"))
+        # Bindings made so far, as (env, variable) pairs.
+        trail = []
+        # Choice points: [goal, facts, rules, next alternative, trail length]
+        choices = []
+
         # Target is the single goal
-        goal.rule.goals = [term]
-        if trace:
-            print("stack", goal)
+        root = {}
+        goal = Goal(term, root)
 
         # Begin the search.
-        stack = [goal]
-        while stack:
-            # Next goal to consider:
-            c = stack.pop()
-            if trace:
-                print("  pop", c)
-
-            # Is this one finished?
-            if c.inx >= len(c.rule.goals):
-                # Yes. Our original goal?
-                if c.parent is None:
-                    if c.env:
-                        # Yes. tell user we
-                        print(c.env)
-                    else:
-                        # have a solution
-                        returnValue = True
-                    continue
-
-                # Otherwise, resume parent goal.
-                parent = deepcopy(c.parent)
-
-                unify(c.rule.head, c.env, parent.rule.goals[parent.inx], parent.env)
+        while True:
+            if goal is None:
+                # Every goal is solved.
+                if root:
+                    # Yes. tell user we
+                    print(root)
+                elif not count:
+                    # have a solution, which is all we need to know.
+                    Prover.record(goals, unifications)
+                    return True
+                elif grounding is None:
+                    factProof = True
+                else:
+                    groundings.add(grounding)
 
-                # Advance to next goal in body.
-                parent.inx = parent.inx + 1
+            elif goal.head is not None:
+                # A rule body is solved, so return to the goal it was for.
                 if trace:
-                    print("stack", parent)
-                # Let it wait its turn.
-                stack.append(parent)
+                    print("  exit", goal.term)
+                unifications += 1
+                unify(goal.head, goal.headEnv, goal.term, goal.env, trail)
+                if goal.env is root:
+                    grounding = (id(goal.head), frozenset(goal.headEnv.items()))
+                goal = goal.next
                 continue
 
-            # No. more to do with this goal.
-            # What we want to solve:
-            term = c.rule.goals[c.inx]
-            for rule in rules:
-                # Walk down the rule database.
-                if rule.head.pred != term.pred:
-                    continue
-                if len(rule.head.args) != len(term.args):
+            else:
+                # What we want to solve:
+                if trace:
+                    print("  call", goal.term)
+                goals += 1
+                choices.append(
+                    [
+                        goal,
+                        index.matchFacts(goal.term, goal.env),
+                        index.candidates(goal.term, goal.env),
+                        0,
+                        len(trail),
+                    ]
+                )
+
+            # Resume from the most recent choice point with alternatives left.
+            resumed = False
+            while choices:
+                choice = choices[-1]
+                current, facts, rules, position, mark = choice
+
+                # Undo the bindings made since the choice point.
+                while len(trail) > mark:
+                    env, variable = trail.pop()
+                    del env[variable]
+
+                if position < len(facts):
+                    # Ground facts are matched by id, and resolving one
+                    # continues with the next goal right away.
+                    choice[3] = position + 1
+                    unifications += 1
+                    for variable in index.bindFact(
+                        current.term, facts[position], current.env
+                    ):
+                        trail.append((current.env, variable))
+                    if current.env is root:
+                        grounding = None
+                    goal = current.next
+                    resumed = True
+                    break
+
+                if position - len(facts) < len(rules):
+                    choice[3] = position + 1
+                    rule = rules[position - len(facts)]
+                    env = {}
+                    unifications += 1
+                    if unify(current.term, current.env, rule.head, env):
+                        # Solve the body of the rule, then exit back into
+                        # the current goal.
+                        goal = Goal(
+                            current.term, current.env, current.next, rule.head, env
+                        )
+                        for body in reversed(rule.goals):
+                            goal = Goal(body, env, goal)
+                        resumed = True
+                        break
                     continue
-                # A possible subgoal.
-                child = Goal(rule, c)
-                ans = unify(term, c.env, rule.head, child.env)
-                if ans:
-                    # if unifies, stack it up
-                    if trace:
-                        print("stack", child)
-                    stack.append(child)
-        return returnValue
+
+                choices.pop()
+
+            if not resumed:
+                Prover.record(goals, unifications)
+                if count:
+                    return len(groundings) or int(factProof)
+                return False
+
+    @staticmethod
+    def record(goals, unifications):
+        """
+        Count the goals called and the unifications made by a search, if
+        profiling is enabled (see :py:class:`.profiling.Profiler`).
+        """
+        if Profiler.enabled:
+            Profiler.count("goals", goals)
+            Profiler.count("unifications", unifications)
+
+    @staticmethod
+    def getKnowledgeBase(data):
+        """
+        Returns the :py:class:`.KnowledgeBase` for the facts in data.
+
+        The knowledge base is compiled the first time it is needed and kept on
+        ``data.knowledgeBase``, so the facts are only parsed once per Data
+        object. It is compiled again if the facts are replaced.
+        """
+        knowledgeBase = data.knowledgeBase
+        if knowledgeBase is None or knowledgeBase.facts is not data.getFacts():
+            knowledgeBase = KnowledgeBase(data.getFacts())
+            data.knowledgeBase = knowledgeBase
+        return knowledgeBase
 
     @staticmethod
-    def prove(data, example, clause):
+    def prove(data, example, clause, count=False):
         """
         Proves if example satisfies clause given the data.
         Returns True if it satisfies, else return False.
 
-        Prover.rules: contains all of the rules.
+        With ``count=True`` the search does not stop at the first proof, and
+        the number of groundings of the clause for the example is returned
+        instead (see :meth:`.Prover.search` and :meth:`.JoinEngine.counts`).
+
+        The example is proved by :meth:`.Prover.search`, a depth-first search
+        which binds variables in place and backtracks by undoing the bindings
+        recorded on its trail.
+
+        Prover.index: :py:class:`.KnowledgeBase` of the data, with the clause
+        added for the length of the proof.
         Prover.trace: If this is 1, displays the proof tree.
-        Prover.goalID: stores the goal ID.
         """
-        Prover.rules = []
         Prover.trace = 0
-        Prover.goalId = 100
-        Prover.rules += [Rule(fact) for fact in data.getFacts()]
-        Prover.rules += [Rule(clause)]
+        Prover.index = Prover.getKnowledgeBase(data)
+        Profiler.count("proofs")
 
-        # Proves query prolog-style:
-        proofOutcome = Prover.search(Term(example))
+        rule = Rule(clause)
+        Prover.index.add(rule)
+        try:
+            # Proves query prolog-style:
+            proofOutcome = Prover.search(Term(example), count=count)
+        finally:
+            Prover.index.remove(rule)
         return proofOutcome
 
 
+class JoinEngine(object):
+    """
+    Set-at-a-time coverage of a clause over many examples.
+
+    Rather than proving every example on its own, the head of the clause is
+    bound to every example at once, and the body is evaluated as a sequence
+    of hash joins against the fact tables of the :py:class:`.KnowledgeBase`.
+    Each join only keeps the variables that are needed later on, and the
+    examples whose head bindings survive every join are covered.
+
+    The result is the same as calling :meth:`.Prover.prove` for each example.
+    Cases where the prover's behavior is not a plain join (recursive clauses,
+    facts containing variables, repeated unbound variables in a literal, and
+    non-ground examples) are handed to the prover.
+    """
+
+    @staticmethod
+    def coverage(data, clause, examples):
+        """
+        Returns the examples which satisfy clause, in the order given.
+
+        :param data: Data containing the facts.
+        :type data: :py:class:`.utils.Data`
+
+        :param clause: Clause of the form ``head:-literal,literal,...``
+        :type clause: str.
+
+        :param examples: Examples to check.
+        :type examples: list of str.
+        """
+        examples = list(examples)
+        knowledgeBase = Prover.getKnowledgeBase(data)
+        rule = Rule(clause)
+        head = rule.head
+
+        plan = JoinEngine._plan(knowledgeBase, rule)
+        if plan is None:
+            return [e for e in examples if Prover.prove(data, e, clause)]
+        headVariables, seeds, facts, others = JoinEngine._seeds(
+            knowledgeBase, head, examples
+        )
+
+        # Examples which are facts themselves are always covered, and the
+        # examples which cannot be bound to the head are left to the prover.
+        covered = set(facts)
+        for i in others:
+            if Prover.prove(data, examples[i], clause):
+                covered.add(i)
+
+        # Join the body literals one at a time.
+        columns = headVariables
+        rows = set(seeds)
+        for step in plan:
+            if not rows:
+                break
+            columns, rows = JoinEngine._join(knowledgeBase, columns, rows, step)
+
+        for row in rows:
+            covered.update(seeds[row[: len(headVariables)]])
+
+        return [examples[i] for i in sorted(covered)]
+
+    @staticmethod
+    def counts(data, clause, examples):
+        """
+        Returns the number of groundings of clause for each example, in the
+        order given, as :meth:`.Prover.prove` with ``count=True`` does.
+
+        A grounding is a distinct binding of every variable of the clause
+        which satisfies its body. An example which is a fact counts as one
+        grounding when the body has none for it.
+        """
+        examples = list(examples)
+        knowledgeBase = Prover.getKnowledgeBase(data)
+        rule = Rule(clause)
+
+        plan = JoinEngine._plan(knowledgeBase, rule)
+        if plan is None:
+            return [Prover.prove(data, e, clause, count=True) for e in examples]
+        headVariables, seeds, facts, others = JoinEngine._seeds(
+            knowledgeBase, rule.head, examples, seedFacts=True
+        )
+
+        counts = [0] * len(examples)
+        for i in others:
+            counts[i] = Prover.prove(data, examples[i], clause, count=True)
+
+        # Join the body keeping every variable, so that each row is one
+        # grounding.
+        variables = set(
+            arg for term in [rule.head] + rule.goals for arg in term.args if arg <= "Z"
+        )
+        columns = headVariables
+        rows = set(seeds)
+        for step in plan:
+            if not rows:
+                break
+            step[4] = variables
+            columns, rows = JoinEngine._join(knowledgeBase, columns, rows, step)
+
+        for row in rows:
+            for i in seeds[row[: len(headVariables)]]:
+                counts[i] += 1
+        for i in facts:
+            counts[i] = max(counts[i], 1)
+        return counts
+
+    @staticmethod
+    def _seeds(knowledgeBase, head, examples, seedFacts=False):
+        """
+        Binds the head of a clause to every example.
+
+        Returns the distinct head variables (in order of appearance), a
+        dictionary mapping the symbol ids each example binds them to (seeds)
+        to the positions of these examples, the positions of the examples
+        which are facts themselves, and the positions of the examples which
+        have to be left to the prover.
+
+        :param seedFacts: Also bind the head to the examples which are
+                          facts, instead of only listing them.
+        """
+        headKey = (head.pred, len(head.args))
+        headFacts = set(knowledgeBase.getTable(knowledgeBase.getKey(head)))
+        lookup = knowledgeBase.symbols.lookup
+
+        # Distinct head variables, in order of appearance.
+        headVariables = []
+        for arg in head.args:
+            if arg <= "Z" and arg not in headVariables:
+                headVariables.append(arg)
+
+        seeds = {}
+        facts = []
+        others = []
+        for i in range(len(examples)):
+            term = Term(examples[i])
+            args = term.args
+            if (term.pred, len(args)) != headKey or any(arg <= "Z" for arg in args):
+                others.append(i)
+                continue
+
+            if tuple(lookup(arg) for arg in args) in headFacts:
+                facts.append(i)
+                if not seedFacts:
+                    continue
+
+            env = {}
+            for headArg, arg in zip(head.args, args):
+                if headArg <= "Z":
+                    if env.setdefault(headArg, arg) != arg:
+                        break
+                elif headArg != arg:
+                    break
+            else:
+                # Constants which are not in the symbol table are looked up
+                # as None, which matches no fact.
+                seed = tuple(lookup(env[variable]) for variable in headVariables)
+                seeds.setdefault(seed, []).append(i)
+
+        return headVariables, seeds, facts, others
+
+    @staticmethod
+    def _join(knowledgeBase, columns, rows, step):
+        """
+        Joins rows (tuples of symbol ids of the variables in columns) with
+        the facts of one body literal, given its entry of the plan. Returns
+        the columns and the rows of the result.
+        """
+        key, consts, bound, new, keep = step
+        lookup = knowledgeBase.symbols.lookup
+        columnIndex = dict((v, c) for c, v in enumerate(columns))
+        joinIndex = knowledgeBase.getJoinIndex(
+            key,
+            tuple(p for p, _ in consts) + tuple(p for p, _ in bound),
+            tuple(p for p, _ in new),
+        )
+        constKey = tuple(lookup(value) for _, value in consts)
+        boundColumns = [columnIndex[v] for _, v in bound]
+        columns = columns + [v for _, v in new]
+        keepColumns = [c for c, v in enumerate(columns) if v in keep]
+
+        joined = set()
+        for row in rows:
+            matches = joinIndex.get(constKey + tuple(row[c] for c in boundColumns), ())
+            for match in matches:
+                extended = row + match
+                joined.add(tuple(extended[c] for c in keepColumns))
+
+        if Profiler.enabled:
+            Profiler.count("joins")
+            Profiler.count("probes", len(rows))
+            Profiler.count("rowsJoined", len(joined))
+
+        return [columns[c] for c in keepColumns], joined
+
+    @staticmethod
+    def _plan(knowledgeBase, rule):
+        """
+        Returns a list with one ``(key, consts, bound, new, keep)`` entry per
+        body literal, or None if the clause has to be left to the prover.
+
+        consts and bound are lists of ``(position, constant)`` and
+        ``(position, variable)`` that must match, new is a list of
+        ``(position, variable)`` for variables first bound by the literal, and
+        keep is the set of variables still needed after the join.
+        """
+        head = rule.head
+        headKey = (head.pred, len(head.args))
+        if knowledgeBase.getKey(head) in knowledgeBase.variableTables:
+            return None
+
+        plan = []
+        boundVariables = set(arg for arg in head.args if arg <= "Z")
+        for goal in rule.goals:
+            if (goal.pred, len(goal.args)) == headKey:
+                # The clause could be used to prove its own body.
+                return None
+            key = knowledgeBase.getKey(goal)
+            if key in knowledgeBase.variableTables:
+                return None
+
+            consts, bound, new = [], [], []
+            for position in range(len(goal.args)):
+                arg = goal.args[position]
+                if arg > "Z":
+                    consts.append((position, arg))
+                elif arg in boundVariables:
+                    bound.append((position, arg))
+                elif arg in [v for _, v in new]:
+                    # The prover only binds the first occurrence.
+                    return None
+                else:
+                    new.append((position, arg))
+            boundVariables.update(v for _, v in new)
+            plan.append([key, consts, bound, new, None])
+
+        # Variables which are needed after each join: head variables and
+        # variables used by a later literal.
+        keep = set(arg for arg in head.args if arg <= "Z")
+        for i in range(len(plan) - 1, -1, -1):
+            plan[i][4] = set(keep)
+            keep.update(arg for arg in rule.goals[i].args if arg <= "Z")
+
+        return plan
+
+
+class QueryPack(object):
+    """
+    The bindings of a clause's variables for each of a set of examples,
+    against which clauses extending it by one literal are evaluated.
+
+    Without a pack, every candidate test at a node is evaluated by joining
+    all the tests of the node's clause again. With one, these joins are done
+    once for the node (see :meth:`.node.coverTests`), and each test only
+    joins its own literal with the bindings they gave.
+
+    The bindings are computed the first time they are needed. Clauses whose
+    body the :py:class:`.JoinEngine` hands to the prover are evaluated
+    without the pack.
+
+    .. code-block:: python
+
+                    from rfgb.logic import QueryPack
+
+                    pack = QueryPack(data, "cancer(A):-friends(A,B)", examples)
+                    pack.coverage("cancer(A):-friends(A,B),smokes(B)", examples)
+    """
+
+    def __init__(self, data, clause, examples):
+        """
+        :param data: Data containing the facts.
+        :type data: :py:class:`.utils.Data`
+
+        :param clause: Clause of the form ``head:-literal,literal,...``, where
+                       the body may be empty and literals may also be
+                       separated (or ended) by ';'.
+        :type clause: str.
+
+        :param examples: Examples the bindings are computed for.
+        :type examples: list of str.
+        """
+        self.data = data
+        self.examples = list(examples)
+        self.positions = dict((e, i) for i, e in enumerate(self.examples))
+
+        head, _, body = clause.partition(":-")
+        body = body.replace(";", ",").strip(",")
+        self.rule = Rule(head + ":-" + body) if body else Rule(head)
+        self.built = False
+
+        # Set when the bindings are built (see QueryPack._build).
+        self.columns = None
+        self.rows = None
+        # Number of head variables, which come first in every row.
+        self.width = 0
+        self.seeds = None
+        self.facts = None
+        self.others = None
+
+    def _build(self):
+        """
+        Joins the body of the clause, keeping every variable, unless the
+        clause has to be left to the prover.
+        """
+        self.built = True
+        knowledgeBase = Prover.getKnowledgeBase(self.data)
+        plan = JoinEngine._plan(knowledgeBase, self.rule)
+        if plan is None:
+            return
+        Profiler.count("queryPacks")
+
+        variables = set(
+            arg
+            for term in [self.rule.head] + self.rule.goals
+            for arg in term.args
+            if arg <= "Z"
+        )
+        columns, seeds, facts, others = JoinEngine._seeds(
+            knowledgeBase, self.rule.head, self.examples
+        )
+        width = len(columns)
+        rows = set(seeds)
+        for step in plan:
+            if not rows:
+                break
+            step[4] = variables
+            columns, rows = JoinEngine._join(knowledgeBase, columns, rows, step)
+
+        self.columns = columns
+        self.rows = rows
+        self.width = width
+        self.seeds = seeds
+        self.facts = set(facts)
+        self.others = others
+
+    def coverage(self, clause, examples):
+        """
+        Returns the examples which satisfy clause, in the order given.
+
+        :param clause: The clause of the pack with one more literal at the
+                       end of its body.
+        :type clause: str.
+
+        :param examples: Examples to check, among the examples of the pack.
+        :type examples: list of str.
+        """
+        if not self.built:
+            self._build()
+
+        knowledgeBase = Prover.getKnowledgeBase(self.data)
+        rule = Rule(clause)
+        plan = None
+        if self.rows is not None:
+            plan = JoinEngine._plan(knowledgeBase, rule)
+        if plan is None:
+            return JoinEngine.coverage(self.data, clause, examples)
+
+        requested = set(self.positions[example] for example in examples)
+        width = self.width
+        rows = self.rows
+        if len(requested) < len(self.examples):
+            seeds = self.seeds
+            rows = [row for row in rows if not requested.isdisjoint(seeds[row[:width]])]
+
+        covered = self.facts & requested
+        for i in self.others:
+            if i in requested and Prover.prove(self.data, self.examples[i], clause):
+                covered.add(i)
+
+        if rows:
+            _, rows = JoinEngine._join(knowledgeBase, self.columns, rows, plan[-1])
+            for row in rows:
+                covered.update(self.seeds[row[:width]])
+
+        return [e for e in examples if self.positions[e] in covered]
+
+
 class Logic(object):
     """
     Class for logic operations.
+
+    :param engine: How the coverage of a clause is computed, either
+                   ``"join"`` (:py:class:`.JoinEngine`) or ``"prover"``
+                   (one :meth:`.Prover.prove` per example).
+    :param testCache: Arguments of the tests generated for each literal,
+                      clause variables and variable types.
     """
 
+    engine = "join"
+    testCache = {}
+    testCacheSize = 10000
+
+    @staticmethod
+    def setEngine(engine):
+        """
+        Set the engine used by :meth:`.Logic.coverage`.
+        """
+        if engine not in ("join", "prover"):
+            raise ValueError("Unknown coverage engine: %s" % engine)
+        Logic.engine = engine
+
+    @staticmethod
+    def coverage(data, clause, examples, pack=None):
+        """
+        Returns the examples which satisfy clause given the data, in the
+        order they were given.
+
+        Coverage is remembered in the :py:class:`.CoverageCache` of the
+        knowledge base of data, so the clause (or the same clause with its
+        variables renamed) is only evaluated on examples it was not
+        evaluated on before.
+
+        :param pack: :py:class:`.QueryPack` of the clause without its last
+                     literal, for (at least) these examples. Only the last
+                     literal is then joined, when using the join engine.
+        """
+        cache = Prover.getKnowledgeBase(data).coverageCache
+        known, missing = cache.lookup(clause, examples)
+        Profiler.setting("engine", Logic.engine)
+        Profiler.count("coverages")
+        if not missing:
+            Profiler.count("coveragesCached")
+            return known
+        Profiler.count("examplesEvaluated", len(missing))
+
+        if pack is not None and Logic.engine == "join":
+            covered = pack.coverage(clause, missing)
+        else:
+            covered = Logic.evaluate(data, clause, missing)
+        cache.store(clause, missing, covered)
+        if not known:
+            return covered
+        covered = set(covered)
+        covered.update(known)
+        return [example for example in examples if example in covered]
+
+    @staticmethod
+    def evaluate(data, clause, examples):
+        """
+        Returns the examples which satisfy clause given the data, computed
+        with the engine set by :meth:`.Logic.setEngine` and without the
+        cache.
+        """
+        if Logic.engine == "join":
+            return JoinEngine.coverage(data, clause, examples)
+        return [example for example in examples if Prover.prove(data, example, clause)]
+
     @staticmethod
     def constantsPresentInLiteral(literalTypeSpecification):
         """
@@ -245,10 +1298,54 @@ class Logic(object):
 
         return variables
 
+    @staticmethod
+    def newVariable(variableType, usedVariables):
+        """
+        Returns the first variable, in alphabetical order, which is not in
+        usedVariables and is not already known to be of another type than
+        variableType.
+
+        Naming new variables this way means the same test is always
+        generated with the same variable names, and a variable keeps the
+        same type in every test.
+        """
+        variableTypes = Utils.data.variableType
+        variables = sorted(Utils.UniqueVariableCollection)
+        for variable in variables:
+            if variable in usedVariables:
+                continue
+            if variableTypes.get(variable, variableType) == variableType:
+                return variable
+        for variable in variables:
+            if variable not in usedVariables:
+                return variable
+        raise ValueError("No variable left to add to the clause.")
+
     @staticmethod
     def generateTests(literalName, literalTypeSpecification, clause):
         """
         Generates tests for literal according to modes and types.
+
+        Tests are generated in a canonical form: existing variables are used
+        in alphabetical order, and new variables are named with
+        :meth:`.Logic.newVariable`, so tests which only differ in the names
+        of their new variables are only generated once.
+        """
+        return list(
+            OrderedDict.fromkeys(
+                Logic.iterateTests(literalName, literalTypeSpecification, clause)
+            )
+        )
+
+    @staticmethod
+    def iterateTests(literalName, literalTypeSpecification, clause):
+        """
+        Yields the tests of :meth:`.Logic.generateTests` one at a time,
+        without building the list of them, so literals with many constants
+        or a high arity can be streamed to the scorer.
+
+        The arguments allowed at each position of the literal are remembered
+        for every set of clause variables and variable types.
         """
 
         target = clause.split(":-")[0]
@@ -263,7 +1360,34 @@ class Logic(object):
             for literal in bodyLiterals:
                 bodyVariables += Logic.getVariables(literal)
 
-        clauseVariables = set(targetVariables + bodyVariables)
+        clauseVariables = frozenset(targetVariables + bodyVariables)
+
+        key = (
+            literalName,
+            tuple(literalTypeSpecification),
+            clauseVariables,
+            frozenset(Utils.data.variableType.items()),
+        )
+        testSpecification = Logic.testCache.get(key)
+        if testSpecification is None:
+            testSpecification = Logic.getTestSpecification(
+                literalTypeSpecification, clauseVariables
+            )
+            if len(Logic.testCache) >= Logic.testCacheSize:
+                Logic.testCache.clear()
+            Logic.testCache[key] = testSpecification
+
+        # Form predicates for all the test candidates for this literal
+        for item in itertools.product(*testSpecification):
+            yield literalName + "(" + ",".join(item) + ")"
+
+    @staticmethod
+    def getTestSpecification(literalTypeSpecification, clauseVariables):
+        """
+        Returns, for each position of a literal, the list of variables or
+        constants a test can have there given the variables of the clause.
+        """
+        usedVariables = set(clauseVariables)
         lengthOfSpecification = len(literalTypeSpecification)
 
         testSpecification = []
@@ -285,7 +1409,7 @@ class Logic(object):
                     # Get all clause variables of same type:
 
                     variableOfSameTypeInClause = []
-                    for var in clauseVariables:
+                    for var in sorted(clauseVariables):
                         if Utils.data.variableType[var] == variableType:
                             variableOfSameTypeInClause.append(var)
 
@@ -293,32 +1417,19 @@ class Logic(object):
                         # If variables of same type exist in clause
                         testSpecification.append(variableOfSameTypeInClause)
                     else:
-                        newVar = None
-                        while True:
-                            newVar = sample(Utils.UniqueVariableCollection, 1)
-                            if newVar[0] not in clauseVariables:
-                                break
-                        testSpecification.append([newVar[0]])
+                        newVar = Logic.newVariable(variableType, usedVariables)
+                        usedVariables.add(newVar)
+                        testSpecification.append([newVar])
 
                 # Use new variable.
                 if mode == "-":
-                    newVar = None
-                    while True:
-                        newVar = sample(Utils.UniqueVariableCollection, 1)
-                        if newVar[0] not in clauseVariables:
-                            break
-                    testSpecification.append([newVar[0]])
+                    newVar = Logic.newVariable(variableType, usedVariables)
+                    usedVariables.add(newVar)
+                    testSpecification.append([newVar])
 
             # If data type is constant:
             else:
                 listToAppend = literalTypeSpecification[i][1:-1].split(";")
                 testSpecification.append(listToAppend)
 
-        testVariablesAndConstants = Utils.cartesianProduct(testSpecification)
-        literalCandidates = []
-
-        # Form predicates and return all the test candidates for this literal
-        for item in testVariablesAndConstants:
-            literalCandidate = literalName + "(" + ",".join(item) + ")"
-            literalCandidates.append(literalCandidate)
-        return literalCandidates
+        return testSpecification
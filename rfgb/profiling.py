@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017-2019 rfgb Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (at the base of this repository). If not,
+# see <http://www.gnu.org/licenses/>
+
+"""
+Counters and timers for finding out where learning and inference spend
+their time.
+
+Profiling is disabled by default, in which case counting and timing do
+nothing. Worker processes (see :meth:`.node.setJobs` and the
+``parallelTargets`` argument of :func:`rfgb.rdn.learn`) send back what
+they collected with each task, and it is merged into the counts and times
+of the parent, so the times of workers running side by side add up.
+
+The report always has the work counters of both coverage engines, and the
+engine in use under ``settings``. ``proofs``, ``goals`` and
+``unifications`` count the work of the prover, which the join engine
+only falls back to for clauses it cannot join. ``examplesEvaluated``
+counts the examples whose coverage had to be computed by either engine,
+and ``joins``, ``probes`` and ``rowsJoined`` count the joins of the join
+engine, the rows looked up in the fact tables and the rows they gave.
+
+.. code-block:: python
+
+                from rfgb import rdn
+                from rfgb.profiling import Profiler
+
+                Profiler.enable()
+                rdn.learn(['cancer'], path='testDomains/ToyCancer/train/')
+                Profiler.save('profile.json')
+
+                Profiler.report()['counters']['proofs']
+                Profiler.report()['settings']['engine']
+"""
+
+from __future__ import division
+
+import json
+import os
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class _NullTimer(object):
+    """
+    Timer used while profiling is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _Timer(object):
+    """
+    Adds the time spent in a with block to the times of a timer.
+    """
+
+    def __init__(self, times):
+        self.times = times
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.times.append(time.time() - self.start)
+        return False
+
+
+class Profiler(object):
+    """
+    Collects counters and timers while enabled.
+
+    :param enabled: Whether counts and times are collected.
+    :param counters: Dictionary mapping counter names to counts.
+    :param timers: Dictionary mapping timer names to lists of durations (in
+                   seconds).
+    :param settings: Dictionary mapping setting names to the value they had
+                     while counting, such as the coverage engine.
+    """
+
+    # Counters which are always reported, even when nothing was counted.
+    COUNTERS = [
+        "proofs",
+        "goals",
+        "unifications",
+        "examplesEvaluated",
+        "joins",
+        "probes",
+        "rowsJoined",
+    ]
+
+    enabled = False
+    counters = {}
+    timers = {}
+    settings = {}
+
+    _null = _NullTimer()
+
+    @staticmethod
+    def enable():
+        """
+        Start collecting counts and times, discarding the previous ones.
+        """
+        Profiler.reset()
+        Profiler.enabled = True
+
+    @staticmethod
+    def disable():
+        """
+        Stop collecting counts and times.
+        """
+        Profiler.enabled = False
+
+    @staticmethod
+    def reset():
+        """
+        Discard the counts and times collected so far.
+        """
+        Profiler.counters = {}
+        Profiler.timers = {}
+        Profiler.settings = {}
+
+    @staticmethod
+    def count(name, n=1):
+        """
+        Add n to the counter name, if profiling is enabled.
+        """
+        if Profiler.enabled:
+            Profiler.counters[name] = Profiler.counters.get(name, 0) + n
+
+    @staticmethod
+    def setting(name, value):
+        """
+        Record the value of the setting name, if profiling is enabled.
+        """
+        if Profiler.enabled:
+            Profiler.settings[name] = value
+
+    @staticmethod
+    def collect():
+        """
+        Returns the counts, times and settings collected so far and discards
+        them, or None if profiling is disabled. Worker processes return this
+        with the result of each task, for :meth:`.Profiler.merge`.
+        """
+        if not Profiler.enabled:
+            return None
+        collected = {
+            "counters": Profiler.counters,
+            "timers": Profiler.timers,
+            "settings": Profiler.settings,
+        }
+        Profiler.reset()
+        return collected
+
+    @staticmethod
+    def merge(collected):
+        """
+        Add the counts, times and settings returned by
+        :meth:`.Profiler.collect` (in a worker process) to the ones
+        collected here, if profiling is enabled.
+        """
+        if not Profiler.enabled or collected is None:
+            return
+        for name, n in collected["counters"].items():
+            Profiler.count(name, n)
+        for name, times in collected["timers"].items():
+            Profiler.timers.setdefault(name, []).extend(times)
+        Profiler.settings.update(collected["settings"])
+
+    @staticmethod
+    def timer(name):
+        """
+        Returns a context manager timing its with block under name, if
+        profiling is enabled.
+
+        .. code-block:: python
+
+                        with Profiler.timer('tree'):
+                            node.learnTree(data)
+        """
+        if not Profiler.enabled:
+            return Profiler._null
+        return _Timer(Profiler.timers.setdefault(name, []))
+
+    @staticmethod
+    def peakMemory():
+        """
+        Returns the peak resident set size, in bytes, of this process and of
+        its terminated child processes, or None where it is not available.
+        """
+        if resource is None:
+            return None
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+        unit = 1 if os.uname()[0] == "Darwin" else 1024
+        return {
+            "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            * unit,
+        }
+
+    @staticmethod
+    def report():
+        """
+        Returns the counters, a summary of the timers, the settings, and the
+        peak memory.
+        """
+        counters = dict.fromkeys(Profiler.COUNTERS, 0)
+        counters.update(Profiler.counters)
+        timers = {}
+        for name, times in Profiler.timers.items():
+            timers[name] = {
+                "count": len(times),
+                "total": sum(times),
+                "mean": sum(times) / len(times) if times else 0.0,
+                "max": max(times) if times else 0.0,
+                "times": list(times),
+            }
+        return {
+            "counters": counters,
+            "timers": timers,
+            "settings": dict(Profiler.settings),
+            "peakMemory": Profiler.peakMemory(),
+        }
+
+    @staticmethod
+    def save(path):
+        """
+        Write :meth:`.Profiler.report` to path as JSON.
+        """
+        with open(path, "w") as f:
+            json.dump(Profiler.report(), f, indent=2, sort_keys=True)
@@ -20,6 +20,7 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 from ..boosting import performInference
+from ..profiling import Profiler
 from ..utils import Utils
 
 
@@ -53,7 +54,8 @@ def infer(target, trees, path="", regression=False):
     testData = Utils.readTestData(target, path=path, regression=regression)
 
     # Get the probability of the test examples.
-    performInference(testData, trees)
+    with Profiler.timer("inference"):
+        performInference(testData, trees)
 
     if regression:
         return testData.examples
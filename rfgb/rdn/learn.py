@@ -19,10 +19,20 @@
 from __future__ import print_function
 from __future__ import absolute_import
 
+from ..boosting import computeSumsOfGradients
+from ..boosting import sampleExamples
 from ..boosting import updateGradients
+from ..boosting import updateSumsOfGradients
+from ..logic import KnowledgeBase
+from ..profiling import Profiler
 from ..tree import node
+from ..utils import ModelWriter
 from ..utils import Utils
 
+# Arguments of _learnTarget shared with worker processes (set before they
+# are forked).
+_shared = {}
+
 
 def learn(
     targets,
@@ -34,6 +44,15 @@ def learn(
     alpha=0.0,
     beta=0.0,
     saveJson=True,
+    n_jobs=1,
+    parallelTargets=False,
+    maxTests=None,
+    sampleFraction=1.0,
+    negPosRatio=None,
+    gradientSampling=False,
+    warm_start=None,
+    vectorized=False,
+    coverageCacheSize=None,
 ):
     """
     .. versionadded:: 0.3.0
@@ -47,7 +66,8 @@ def learn(
     :param targets: List of target predicates to learn models for.
     :type targets: list of str.
 
-    :param numTrees: Number of trees to learn.
+    :param numTrees: Number of trees to learn (in total, counting the trees
+                     of warm_start).
     :type numTrees: int.
 
     :param path: Path to the location training data is stored.
@@ -59,60 +79,275 @@ def learn(
     :param advice: Read an advice file from the same directory as trainPath.
     :type advice: bool.
 
+    :param n_jobs: Number of processes used to score candidate tests (or to
+                   learn targets, with parallelTargets). The trees learned do
+                   not depend on it.
+    :type n_jobs: int.
+
+    :param parallelTargets: Learn the models for different targets in
+                            n_jobs parallel processes, each saving its model
+                            as soon as it is learned.
+    :type parallelTargets: bool.
+
+    :param maxTests: Maximum number of candidate tests scored at a node.
+                     Nodes with more candidates score a uniform random sample
+                     of them.
+    :type maxTests: int.
+
+    :param sampleFraction: Fraction of the examples each tree is learned
+                           from, sampled again for every tree. The gradients
+                           of every example are still updated after each
+                           tree.
+    :type sampleFraction: float.
+
+    :param negPosRatio: Maximum number of negatives per positive each tree
+                        is learned from.
+    :type negPosRatio: float.
+
+    :param gradientSampling: Sample examples with a probability proportional
+                             to the magnitude of their gradient instead of
+                             uniformly.
+    :type gradientSampling: bool.
+
+    :param warm_start: Dictionary mapping targets to trees learned before,
+                       either as a list of trees or as a model loaded with
+                       :meth:`.Utils.load`. Boosting continues after these
+                       trees instead of starting over.
+    :type warm_start: dict.
+
+    :param vectorized: Store the values of the examples in NumPy arrays and
+                       update their gradients all at once (see
+                       :meth:`.Data.useArrays`). The trees learned have the
+                       same structure, and leaf values equal up to float
+                       rounding.
+    :type vectorized: bool.
+
+    :param coverageCacheSize: Maximum number of bytes used to remember the
+                              examples covered by clauses across trees (see
+                              :py:class:`.logic.CoverageCache`), 0 to
+                              disable it.
+    :type coverageCacheSize: int.
+
     :default regression: False
     :default advice: False
+    :default n_jobs: 1
+    :default parallelTargets: False
+    :default maxTests: None (score every candidate)
+    :default sampleFraction: 1.0 (every example)
+    :default negPosRatio: None (every negative)
+    :default gradientSampling: False
+    :default warm_start: None
+    :default vectorized: False
+    :default coverageCacheSize: None (CoverageCache.maxSize, 128 MB)
 
     :returns: Dictionary where the key is the target and the value is the
               set of trees returned for that target.
     :rtype: dict.
+
+    Example:
+
+    .. code-block:: python
+
+                    from rfgb import rdn
+                    from rfgb.utils import Utils
+
+                    # Add 10 trees to a saved model of 50 trees.
+                    model = Utils.load('.rfgb/models/cancer.json')
+                    trees = rdn.learn(['cancer'], numTrees=60, path='train/',
+                                      warm_start={'cancer': model})
     """
 
+    # The facts are shared by every target, so they are read and compiled
+    # into a knowledge base once.
+    with open(path + "facts.txt") as fac:
+        facts = fac.read().splitlines()
+
+    _shared.clear()
+    _shared.update(
+        facts=facts,
+        knowledgeBase=KnowledgeBase(facts, coverageCacheSize=coverageCacheSize),
+        numTrees=numTrees,
+        path=path,
+        regression=regression,
+        advice=advice,
+        softm=softm,
+        alpha=alpha,
+        beta=beta,
+        saveJson=saveJson,
+        sampleFraction=sampleFraction,
+        negPosRatio=negPosRatio,
+        gradientSampling=gradientSampling,
+        vectorized=vectorized,
+        warmStart=dict(
+            (target, _warmStartTrees(trees))
+            for target, trees in (warm_start or {}).items()
+        ),
+    )
+
+    node.setMaxTests(maxTests)
+
     # Models will be returned as a dictionary, where the name of the predicate
     # will be bound to the set of trees learned for it.
     models = {}
 
-    for target in targets:
+    # The number of jobs of node is restored once the targets are learned.
+    jobs = node.jobs
+    pool = None
+    if parallelTargets and n_jobs > 1 and len(targets) > 1:
+        # Each worker scores its tests serially.
+        node.setJobs(1)
+        pool = Utils.forkPool(min(n_jobs, len(targets)))
+    else:
+        node.setJobs(n_jobs)
 
-        # Read the training data.
-        trainData = Utils.readTrainingData(
-            target,
-            path=path,
-            regression=regression,
-            advice=advice,
-            softm=softm,
-            alpha=alpha,
-            beta=beta,
-        )
+    try:
+        if pool is not None:
+            # Collect the models in the order they finish.
+            for target, trees, collected in pool.imap_unordered(
+                _learnTargetTask, targets
+            ):
+                Profiler.merge(collected)
+                models[target] = trees
+        else:
+            for target in targets:
+                models[target] = _learnTarget(target, **_shared)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        node.closePool()
+        node.setJobs(jobs)
 
-        # Initialize an empty list for the trees.
-        trees = []
+    return models
 
-        # Learn each tree and update the gradients.
-        for i in range(numTrees):
 
-            node.setMaxDepth(2)
-            node.learnTree(trainData)
-            trees.append(node.learnedDecisionTree)
-            updateGradients(trainData, trees)
+def _warmStartTrees(model):
+    """
+    Returns the trees of a model, given either as a list of trees or as a
+    ``[params, trees]`` model loaded with :meth:`.Utils.load`.
+    """
+    if len(model) == 2 and isinstance(model[0], dict) and isinstance(model[1], list):
+        return list(model[1])
+    return list(model)
+
+
+def _learnTargetTask(target):
+    """
+    Runs in a worker process: learns the model for one target, and returns
+    it with what was profiled while learning it (see
+    :meth:`.Profiler.collect`).
+    """
+    Profiler.reset()
+    return target, _learnTarget(target, **_shared), Profiler.collect()
 
-            # Save the models learned at this step.
-            if saveJson:
 
-                # Collect the parameters used to learn these trees:
-                params = {
-                    "target": target,
-                    "trees": i + 1,
-                    "regression": regression,
-                    "advice": advice,
-                    "softm": softm,
-                    "alpha": alpha,
-                    "beta": beta,
-                }
+def _learnTarget(
+    target,
+    facts,
+    knowledgeBase,
+    numTrees,
+    path,
+    regression,
+    advice,
+    softm,
+    alpha,
+    beta,
+    saveJson,
+    sampleFraction,
+    negPosRatio,
+    gradientSampling,
+    vectorized,
+    warmStart,
+):
+    """
+    Learn (and save) the trees for one target, given the facts and their
+    compiled knowledge base.
+    """
 
-                # Save a json file containing parameters and trees learned.
-                model = [params, trees]
-                Utils.save(".rfgb/models/" + target + ".json", model)
+    # Read the training data.
+    trainData = Utils.readTrainingData(
+        target,
+        path=path,
+        regression=regression,
+        advice=advice,
+        softm=softm,
+        alpha=alpha,
+        beta=beta,
+        facts=facts,
+    )
+    trainData.knowledgeBase = knowledgeBase
+    if vectorized:
+        trainData.useArrays()
 
-        models[target] = trees
+    # Start from the trees learned before, if any.
+    trees = list(warmStart.get(target, []))
 
-    return models
+    # Running sum of the values given to each example by the trees so far.
+    if trees:
+        # Every clause of the earlier trees is covered once, for all the
+        # examples together.
+        with Profiler.timer("gradients"):
+            sumsOfGradients = computeSumsOfGradients(
+                trainData.getExamples(), trees, trainData
+            )
+            updateGradients(trainData, trees, sumsOfGradients=sumsOfGradients)
+    else:
+        sumsOfGradients = dict.fromkeys(trainData.getExamples(), 0)
+
+    if vectorized:
+        # Keep the sums in the arrays of the data too.
+        arrays = trainData.arrays
+        arrays.scores[:] = arrays.gather(sumsOfGradients)
+        sumsOfGradients = arrays.view(arrays.scores)
+
+    subsample = sampleFraction < 1 or negPosRatio is not None
+
+    # Save the model after each tree by appending it to the model file.
+    writer = None
+    if saveJson:
+        # Collect the parameters used to learn these trees:
+        params = {
+            "target": target,
+            "regression": regression,
+            "advice": advice,
+            "softm": softm,
+            "alpha": alpha,
+            "beta": beta,
+        }
+        writer = ModelWriter(".rfgb/models/" + target + ".json", params)
+        for tree in trees:
+            writer.append(tree)
+
+    try:
+        # Learn each tree and update the gradients.
+        for i in range(len(trees), numTrees):
+            with Profiler.timer("iteration"):
+
+                examples = None
+                if subsample:
+                    examples = sampleExamples(
+                        trainData, sampleFraction, negPosRatio, gradientSampling
+                    )
+
+                with Profiler.timer("tree"):
+                    node.setMaxDepth(2)
+                    node.learnTree(trainData, examples)
+                trees.append(node.learnedDecisionTree)
+
+                with Profiler.timer("gradients"):
+                    # Examples left out of the sample are given the values of
+                    # the tree by inference.
+                    updateSumsOfGradients(
+                        sumsOfGradients, trees[-1], trainData, node.leafValues
+                    )
+                    updateGradients(
+                        trainData, trees, sumsOfGradients=sumsOfGradients
+                    )
+
+            if writer is not None:
+                writer.append(trees[-1])
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return trees
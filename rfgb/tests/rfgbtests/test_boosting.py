@@ -20,9 +20,158 @@
 from __future__ import print_function
 from __future__ import absolute_import
 from ... import boosting
+from ...utils import Data
 import unittest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class BoostingTest(unittest.TestCase):
     def test_foo(self):
         self.assertTrue(True)
+
+
+class SumsOfGradientsTest(unittest.TestCase):
+    """
+    Tests for computing the sum of gradients given by a list of trees.
+    """
+
+    def setUp(self):
+        self.data = Data()
+        self.data.setFacts(
+            ["friends(alice,bob)", "friends(bob,alice)", "smokes(alice)"]
+        )
+        self.data.setPos(["cancer(alice)", "cancer(bob)"], "cancer")
+        self.data.setNeg(["cancer(carl)"], "cancer")
+        self.trees = [
+            ["cancer(A):-smokes(A) 0.5", "cancer(A):- -0.25"],
+            ["cancer(A):-friends(A,B) 1.0", "cancer(A):- 0.0"],
+        ]
+
+    def test_compute_sums_of_gradients(self):
+        sums = boosting.computeSumsOfGradients(
+            self.data.getExamples(), self.trees, self.data
+        )
+        self.assertEqual(
+            sums, {"cancer(alice)": 1.5, "cancer(bob)": 0.75, "cancer(carl)": -0.25}
+        )
+        self.assertEqual(
+            boosting.computeSumOfGradients("cancer(bob)", self.trees, self.data), 0.75
+        )
+
+    def test_update_sums_of_gradients(self):
+        sums = dict.fromkeys(self.data.getExamples(), 0)
+        for tree in self.trees:
+            boosting.updateSumsOfGradients(sums, tree, self.data)
+        self.assertEqual(
+            sums,
+            boosting.computeSumsOfGradients(
+                self.data.getExamples(), self.trees, self.data
+            ),
+        )
+
+
+class SampleExamplesTest(unittest.TestCase):
+    """
+    Tests for sampling the examples each tree is learned from.
+    """
+
+    def setUp(self):
+        self.data = Data()
+        self.data.setPos(["cancer(p%d)" % i for i in range(10)], "cancer")
+        self.data.setNeg(["cancer(n%d)" % i for i in range(100)], "cancer")
+
+    def test_sample_everything(self):
+        self.assertEqual(
+            boosting.sampleExamples(self.data), self.data.getExamples()
+        )
+
+    def test_neg_pos_ratio(self):
+        examples = boosting.sampleExamples(self.data, negPosRatio=2.0)
+        self.assertEqual(examples[:10], list(self.data.pos))
+        self.assertEqual(len(examples), 30)
+        self.assertTrue(all(example in self.data.neg for example in examples[10:]))
+
+    def test_fraction(self):
+        examples = boosting.sampleExamples(self.data, fraction=0.5, negPosRatio=2.0)
+        self.assertEqual(len([e for e in examples if e in self.data.pos]), 5)
+        self.assertEqual(len([e for e in examples if e in self.data.neg]), 10)
+
+    def test_by_gradient(self):
+        for example in self.data.neg:
+            self.data.neg[example] = 0.0
+        self.data.neg["cancer(n7)"] = -0.5
+        examples = boosting.sampleExamples(
+            self.data, negPosRatio=0.1, byGradient=True
+        )
+        self.assertEqual(examples, list(self.data.pos) + ["cancer(n7)"])
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed.")
+class GradientArraysTest(unittest.TestCase):
+    """
+    Gradients updated in arrays should be the ones updated one by one.
+    """
+
+    def classification(self, **kwargs):
+        data = Data(**kwargs)
+        data.setPos(["cancer(alice)", "cancer(bob)"], "cancer")
+        data.setNeg(["cancer(carl)", "cancer(dave)"], "cancer")
+        return data
+
+    def regression(self):
+        data = Data(regression=True)
+        data.setExamples(
+            ["medv(a) 1.0", "medv(b) 2.5", "medv(c) -1.0", "medv(d) 0.25"], "medv"
+        )
+        return data
+
+    def assertSameGradients(self, makeData, **kwargs):
+        sums = {}
+        for i, example in enumerate(makeData().getExamples()):
+            sums[example] = 0.5 * i - 0.5
+
+        expected = makeData()
+        boosting.updateGradients(expected, [], sumsOfGradients=sums, **kwargs)
+
+        data = makeData()
+        data.useArrays()
+        boosting.updateGradients(data, [], sumsOfGradients=sums, **kwargs)
+        for example in expected.getExamples():
+            self.assertAlmostEqual(
+                data.getValue(example), expected.getValue(example), places=12
+            )
+
+    def test_logistic(self):
+        self.assertSameGradients(self.classification)
+
+    def test_softm(self):
+        self.assertSameGradients(
+            lambda: self.classification(softm=True, alpha=0.5, beta=1.5)
+        )
+
+    def test_regression_losses(self):
+        self.assertSameGradients(self.regression, loss="LS")
+        self.assertSameGradients(self.regression, loss="LAD")
+        self.assertSameGradients(self.regression, loss="Huber", delta=0.5)
+
+    def test_update_sums_of_gradients(self):
+        data = self.classification()
+        data.setFacts(["smokes(alice)", "smokes(dave)"])
+        tree = ["cancer(A):-smokes(A) 0.5", "cancer(A):- -0.25"]
+        leafValues = {"cancer(alice)": 0.5, "cancer(carl)": -0.25}
+
+        expected = dict.fromkeys(data.getExamples(), 1.0)
+        boosting.updateSumsOfGradients(expected, tree, data, leafValues)
+
+        data.useArrays()
+        sums = data.arrays.view(data.arrays.scores)
+        for example in data.getExamples():
+            sums[example] = 1.0
+        boosting.updateSumsOfGradients(sums, tree, data, leafValues)
+        self.assertEqual(sorted(sums), sorted(expected))
+        for example in expected:
+            self.assertAlmostEqual(sums[example], expected[example], places=12)
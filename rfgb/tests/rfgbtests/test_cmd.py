@@ -25,9 +25,13 @@ one is created.
 from __future__ import print_function
 from __future__ import absolute_import
 
+from ...cmd import generate
 from ...cmd import init
+from ...cmd.generate import GENERATORS
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 
@@ -72,5 +76,48 @@ class InitTest(unittest.TestCase):
         self.assertEqual(ExitCode.exception.code, 1)
 
 
+class GenerateTest(unittest.TestCase):
+    """
+    Tests for rfgb.cmd.generate
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def read(self, directory, name):
+        with open(os.path.join(directory, name + ".txt")) as f:
+            return f.read().splitlines()
+
+    def test_generate_every_domain(self):
+        for domain in GENERATORS:
+            directory = os.path.join(self.path, domain)
+            generate(domain, directory, 500, seed=0)
+            facts = self.read(directory, "facts")
+            self.assertAlmostEqual(len(facts), 500, delta=50)
+            self.assertTrue(self.read(directory, "pos"))
+            self.assertTrue(self.read(directory, "neg"))
+            self.assertTrue(self.read(directory, "bk"))
+
+    def test_generate_seed(self):
+        first = os.path.join(self.path, "first")
+        second = os.path.join(self.path, "second")
+        generate("ToyCancer", first, 300, seed=3, density=2.5)
+        generate("ToyCancer", second, 300, seed=3, density=2.5)
+        for name in ("facts", "pos", "neg"):
+            self.assertEqual(self.read(first, name), self.read(second, name))
+
+    def test_generate_unknown_domain(self):
+        with self.assertRaises(ValueError):
+            generate("Unknown", self.path, 10)
+
+    def test_generate_density_unsupported(self):
+        with self.assertRaises(ValueError):
+            generate("Logistics", self.path, 10, density=2.0)
+        self.assertFalse(os.path.exists(os.path.join(self.path, "facts.txt")))
+
+
 # Remove directories at end of test.
 reset_directories()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017-2019 rfgb Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (at the base of this repository). If not,
+# see <http://www.gnu.org/licenses/>
+
+"""
+Unit tests for compiler.py
+"""
+
+from __future__ import absolute_import
+from ...boosting import inferTreeValues
+from ...compiler import CompiledModel
+from ...profiling import Profiler
+from ...utils import Data
+import unittest
+
+
+class CompiledModelTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Data()
+        self.data.setFacts(
+            [
+                "smokes(alice)",
+                "smokes(carl)",
+                "friends(alice,bob)",
+                "friends(bob,carl)",
+                "friends(dave,erin)",
+            ]
+        )
+        self.examples = [
+            "cancer(alice)",
+            "cancer(bob)",
+            "cancer(carl)",
+            "cancer(dave)",
+            "cancer(erin)",
+        ]
+        self.trees = [
+            {
+                "head": "cancer(A)",
+                "test": "smokes(A)",
+                "value": 0.1,
+                "true": {"value": 0.75},
+                "false": {
+                    "test": "friends(A,B)",
+                    "value": -0.125,
+                    "true": {"value": 0.25},
+                    "false": {"value": -0.5},
+                },
+            },
+            {
+                "head": "cancer(A)",
+                "test": "friends(A,C)",
+                "value": 0.0,
+                "true": {
+                    "test": "smokes(C)",
+                    "value": 0.125,
+                    "true": {"value": 0.5},
+                },
+                "false": {"value": -0.25},
+            },
+            {
+                "head": "cancer(A)",
+                "test": "smokes(A)",
+                "value": 0.0,
+                "true": {"value": 1.0},
+                "false": {"value": -1.0},
+            },
+        ]
+
+    def test_clauses_are_shared(self):
+        """
+        tests: nodes with the same conjunction of tests share a clause.
+        """
+        model = CompiledModel(self.trees)
+        self.assertEqual(
+            model.clauses,
+            [
+                "cancer(A):-smokes(A)",
+                "cancer(A):-friends(A,B)",
+                "cancer(A):-friends(A,C),smokes(C)",
+            ],
+        )
+
+    def test_sums_of_gradients(self):
+        """
+        tests: CompiledModel.sumsOfGradients gives the sum of the values of
+        each tree.
+        """
+        expected = dict.fromkeys(self.examples, 0)
+        for tree in self.trees:
+            values = inferTreeValues(tree, self.examples, self.data)
+            for example in self.examples:
+                expected[example] += values[example]
+
+        model = CompiledModel(self.trees)
+        self.assertEqual(model.sumsOfGradients(self.examples, self.data), expected)
+
+    def test_each_clause_proved_once(self):
+        """
+        tests: each clause is proved at most once per example.
+        """
+        Profiler.enable()
+        try:
+            CompiledModel(self.trees).sumsOfGradients(self.examples, self.data)
+            evaluated = Profiler.counters["examplesEvaluated"]
+        finally:
+            Profiler.disable()
+        # smokes(A) and friends(A,B) on every example, friends(A,C),smokes(C)
+        # on the examples with a friend.
+        self.assertEqual(evaluated, 5 + 5 + 3)
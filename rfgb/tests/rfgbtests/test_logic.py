@@ -22,6 +22,15 @@ from __future__ import absolute_import
 from ...logic import Term
 from ...logic import Rule
 from ...logic import Logic
+from ...logic import RuleIndex
+from ...logic import Prover
+from ...logic import JoinEngine
+from ...logic import KnowledgeBase
+from ...logic import SymbolTable
+from ...logic import CoverageCache
+from ...logic import QueryPack
+from ...utils import Data
+from ...utils import Utils
 
 import unittest
 
@@ -113,3 +122,465 @@ class RuleTest(unittest.TestCase):
     def test_initialize_bad_rule_2(self):
         with self.assertRaises(Exception):
             rule = Rule("advises(x,y):!-paper(v)")
+
+
+class RuleIndexTest(unittest.TestCase):
+    """
+    Tests for rfgb.logic.RuleIndex
+    """
+
+    def setUp(self):
+        self.facts = [
+            Rule("friends(alice,bob)"),
+            Rule("friends(alice,carl)"),
+            Rule("friends(bob,carl)"),
+            Rule("smokes(alice)"),
+        ]
+        self.index = RuleIndex(self.facts)
+
+    def test_candidates_by_predicate(self):
+        candidates = self.index.candidates(Term("smokes(X)"), {})
+        self.assertEqual(candidates, [self.facts[3]])
+
+    def test_candidates_by_first_argument(self):
+        candidates = self.index.candidates(Term("friends(alice,Y)"), {})
+        self.assertEqual(candidates, self.facts[:2])
+
+    def test_candidates_by_second_argument(self):
+        candidates = self.index.candidates(Term("friends(X,Y)"), {"Y": "carl"})
+        self.assertEqual(candidates, self.facts[1:3])
+
+    def test_candidates_unknown(self):
+        self.assertEqual(self.index.candidates(Term("cancer(X)"), {}), [])
+        self.assertEqual(self.index.candidates(Term("friends(X)"), {}), [])
+        self.assertEqual(self.index.candidates(Term("friends(dan,Y)"), {}), [])
+
+    def test_candidates_variable_head(self):
+        rule = Rule("friends(A,B):-smokes(A)")
+        self.index.add(rule)
+        candidates = self.index.candidates(Term("friends(dan,Y)"), {})
+        self.assertEqual(candidates, [rule])
+        self.index.remove(rule)
+        self.assertEqual(self.index.candidates(Term("friends(dan,Y)"), {}), [])
+
+
+class SymbolTableTest(unittest.TestCase):
+    """
+    Tests for rfgb.logic.SymbolTable
+    """
+
+    def test_intern(self):
+        symbols = SymbolTable()
+        self.assertEqual(symbols.intern("alice"), 0)
+        self.assertEqual(symbols.intern("bob"), 1)
+        self.assertEqual(symbols.intern("alice"), 0)
+        self.assertEqual(symbols.symbols, ["alice", "bob"])
+
+    def test_lookup(self):
+        symbols = SymbolTable()
+        symbols.intern("alice")
+        self.assertEqual(symbols.lookup("alice"), 0)
+        self.assertEqual(symbols.lookup("bob"), None)
+        self.assertEqual(symbols.symbols, ["alice"])
+
+
+class KnowledgeBaseTest(unittest.TestCase):
+    """
+    Tests for rfgb.logic.KnowledgeBase
+    """
+
+    def setUp(self):
+        self.knowledgeBase = KnowledgeBase(
+            ["friends(alice,bob)", "friends(bob,alice)", "smokes(X)"]
+        )
+
+    def test_interned_tables(self):
+        symbols = self.knowledgeBase.symbols
+        key = self.knowledgeBase.getKey(Term("friends(A,B)"))
+        self.assertEqual(key, (symbols.lookup("friends"), 2))
+        self.assertEqual(
+            self.knowledgeBase.getTable(key),
+            [
+                (symbols.lookup("alice"), symbols.lookup("bob")),
+                (symbols.lookup("bob"), symbols.lookup("alice")),
+            ],
+        )
+
+    def test_match_facts(self):
+        matches = self.knowledgeBase.matchFacts(Term("friends(alice,B)"), {})
+        self.assertEqual(len(matches), 1)
+        env = {}
+        self.knowledgeBase.bindFact(Term("friends(alice,B)"), matches[0], env)
+        self.assertEqual(env, {"B": "bob"})
+        self.assertEqual(
+            self.knowledgeBase.matchFacts(Term("friends(A,B)"), {"A": "carl"}), []
+        )
+
+    def test_join_indexes_are_bounded(self):
+        knowledgeBase = KnowledgeBase(
+            ["friends(alice,bob)", "friends(bob,alice)", "smokes(bob)"],
+            joinIndexSize=2,
+        )
+        friends = knowledgeBase.getKey(Term("friends(A,B)"))
+        smokes = knowledgeBase.getKey(Term("smokes(A)"))
+        byFirst = knowledgeBase.getJoinIndex(friends, (0,), (1,))
+        self.assertEqual(knowledgeBase.joinIndexRows, 2)
+        self.assertIs(knowledgeBase.getJoinIndex(friends, (0,), (1,)), byFirst)
+
+        # The least recently used index is dropped to make room.
+        knowledgeBase.getJoinIndex(smokes, (0,), ())
+        self.assertEqual(list(knowledgeBase.joinIndexes), [(smokes, (0,), ())])
+        self.assertEqual(knowledgeBase.joinIndexRows, 1)
+
+    def test_variable_facts_are_rules(self):
+        key = self.knowledgeBase.getKey(Term("smokes(A)"))
+        self.assertTrue(key in self.knowledgeBase.variableTables)
+        self.assertEqual(self.knowledgeBase.getTable(key), [])
+        self.assertEqual(
+            len(self.knowledgeBase.candidates(Term("smokes(alice)"), {})), 1
+        )
+
+
+class ProverTest(unittest.TestCase):
+    """
+    Tests for rfgb.logic.Prover
+    """
+
+    def setUp(self):
+        self.data = Data()
+        self.data.setFacts(
+            ["friends(alice,bob)", "friends(bob,carl)", "smokes(bob)"]
+        )
+
+    def test_prove(self):
+        clause = "cancer(A):-friends(A,B),smokes(B)"
+        self.assertTrue(Prover.prove(self.data, "cancer(alice)", clause))
+        self.assertFalse(Prover.prove(self.data, "cancer(bob)", clause))
+        self.assertFalse(Prover.prove(self.data, "cancer(carl)", clause))
+
+    def test_prove_count(self):
+        self.data.setFacts(
+            [
+                "friends(alice,bob)",
+                "friends(alice,carl)",
+                "friends(alice,dan)",
+                "smokes(bob)",
+                "smokes(carl)",
+            ]
+        )
+        clause = "cancer(A):-friends(A,B),smokes(B)"
+        self.assertEqual(Prover.prove(self.data, "cancer(alice)", clause, count=True), 2)
+        self.assertEqual(Prover.prove(self.data, "cancer(bob)", clause, count=True), 0)
+        self.assertTrue(Prover.prove(self.data, "cancer(alice)", clause))
+
+    def test_prove_count_facts_and_rules(self):
+        # cancer is both a fact and the head of the clause, and a repeated
+        # fact does not add a grounding.
+        self.data.setFacts(
+            [
+                "friends(alice,bob)",
+                "friends(alice,carl)",
+                "friends(erin,bob)",
+                "smokes(bob)",
+                "smokes(bob)",
+                "smokes(carl)",
+                "cancer(alice)",
+                "cancer(dan)",
+            ]
+        )
+        clause = "cancer(A):-friends(A,B),smokes(B)"
+        examples = ["cancer(alice)", "cancer(bob)", "cancer(dan)", "cancer(erin)"]
+        counts = [Prover.prove(self.data, e, clause, count=True) for e in examples]
+        self.assertEqual(counts, [2, 0, 1, 1])
+        self.assertEqual(JoinEngine.counts(self.data, clause, examples), counts)
+
+    def test_knowledge_base_is_reused(self):
+        clause = "cancer(A):-smokes(A)"
+        Prover.prove(self.data, "cancer(bob)", clause)
+        knowledgeBase = self.data.knowledgeBase
+        Prover.prove(self.data, "cancer(alice)", clause)
+        self.assertIs(self.data.knowledgeBase, knowledgeBase)
+
+        # The clause is only part of the knowledge base during the proof.
+        self.assertEqual(knowledgeBase.candidates(Term("cancer(X)"), {}), [])
+
+    def test_knowledge_base_follows_facts(self):
+        clause = "cancer(A):-smokes(A)"
+        self.assertFalse(Prover.prove(self.data, "cancer(carl)", clause))
+        self.data.setFacts(["smokes(carl)"])
+        self.assertTrue(Prover.prove(self.data, "cancer(carl)", clause))
+
+
+class JoinEngineTest(unittest.TestCase):
+    """
+    Tests for rfgb.logic.JoinEngine, which should agree with the Prover.
+    """
+
+    def setUp(self):
+        self.data = Data()
+        self.data.setFacts(
+            [
+                "friends(alice,bob)",
+                "friends(bob,carl)",
+                "friends(carl,alice)",
+                "friends(dan,dan)",
+                "smokes(bob)",
+                "smokes(dan)",
+                "cancer(erin)",
+            ]
+        )
+        self.examples = [
+            "cancer(alice)",
+            "cancer(bob)",
+            "cancer(carl)",
+            "cancer(dan)",
+            "cancer(erin)",
+        ]
+
+    def assertSameCoverage(self, clause):
+        expected = [
+            example
+            for example in self.examples
+            if Prover.prove(self.data, example, clause)
+        ]
+        covered = JoinEngine.coverage(self.data, clause, self.examples)
+        self.assertEqual(covered, expected)
+        return covered
+
+    def test_coverage_single_literal(self):
+        covered = self.assertSameCoverage("cancer(A):-smokes(A)")
+        self.assertEqual(covered, ["cancer(bob)", "cancer(dan)", "cancer(erin)"])
+
+    def test_coverage_join(self):
+        covered = self.assertSameCoverage("cancer(A):-friends(A,B),smokes(B)")
+        self.assertEqual(covered, ["cancer(alice)", "cancer(dan)", "cancer(erin)"])
+
+    def test_coverage_constants(self):
+        self.assertSameCoverage("cancer(A):-friends(A,carl)")
+        self.assertSameCoverage("cancer(A):-friends(A,B),friends(B,alice)")
+
+    def test_coverage_repeated_variables(self):
+        self.assertSameCoverage("cancer(A):-friends(A,A)")
+        self.assertSameCoverage("cancer(A):-friends(B,B)")
+
+    def test_coverage_example_facts(self):
+        covered = self.assertSameCoverage("cancer(A):-friends(A,B),friends(B,A)")
+        self.assertEqual(covered, ["cancer(dan)", "cancer(erin)"])
+
+
+class QueryPackTest(unittest.TestCase):
+    """
+    Tests for rfgb.logic.QueryPack, which should agree with the JoinEngine.
+    """
+
+    def setUp(self):
+        self.data = Data()
+        self.data.setFacts(
+            [
+                "friends(alice,bob)",
+                "friends(bob,carl)",
+                "friends(carl,alice)",
+                "friends(dan,dan)",
+                "smokes(bob)",
+                "smokes(dan)",
+                "cancer(erin)",
+            ]
+        )
+        self.examples = [
+            "cancer(alice)",
+            "cancer(bob)",
+            "cancer(carl)",
+            "cancer(dan)",
+            "cancer(erin)",
+            "cancer(fred)",
+        ]
+        self.tests = [
+            "smokes(A)",
+            "smokes(B)",
+            "smokes(C)",
+            "friends(B,A)",
+            "friends(C,A)",
+            "friends(B,C)",
+            "friends(A,bob)",
+            "friends(A,A)",
+        ]
+
+    def test_coverage(self):
+        for clause in [
+            "cancer(A):-",
+            "cancer(A):-friends(A,B);",
+            "cancer(A):-friends(A,B);friends(B,C);",
+        ]:
+            pack = QueryPack(self.data, clause, self.examples)
+            for test in self.tests:
+                extended = clause.replace(";", ",") + test
+                for examples in [self.examples, self.examples[1:4]]:
+                    self.assertEqual(
+                        pack.coverage(extended, examples),
+                        JoinEngine.coverage(self.data, extended, examples),
+                        extended,
+                    )
+
+    def test_coverage_with_prover(self):
+        """
+        Clauses the join engine leaves to the prover give the same coverage.
+        """
+        pack = QueryPack(self.data, "cancer(A):-friends(A,B)", self.examples)
+        clause = "cancer(A):-friends(A,B),friends(C,C)"
+        self.assertEqual(
+            pack.coverage(clause, self.examples),
+            [e for e in self.examples if Prover.prove(self.data, e, clause)],
+        )
+
+
+class CoverageCacheTest(unittest.TestCase):
+    """
+    Tests for rfgb.logic.CoverageCache
+    """
+
+    def test_canonical(self):
+        self.assertEqual(
+            CoverageCache.canonical("cancer(A):-friends(A,Q),smokes(Q)"),
+            CoverageCache.canonical("cancer(B):-friends(B,R);smokes(R)"),
+        )
+        self.assertEqual(
+            CoverageCache.canonical("cancer(A):-friends(A,bob)"),
+            "cancer(V0):-friends(V0,bob)",
+        )
+        self.assertNotEqual(
+            CoverageCache.canonical("cancer(A):-friends(A,B)"),
+            CoverageCache.canonical("cancer(A):-friends(B,A)"),
+        )
+
+    def test_lookup(self):
+        cache = CoverageCache()
+        examples = ["cancer(alice)", "cancer(bob)"]
+        self.assertEqual(
+            cache.lookup("cancer(A):-smokes(A)", examples), ([], examples)
+        )
+        cache.store("cancer(A):-smokes(A)", examples, ["cancer(bob)"])
+        self.assertEqual(
+            cache.lookup("cancer(X):-smokes(X)", ["cancer(carl)"] + examples),
+            (["cancer(bob)"], ["cancer(carl)"]),
+        )
+        # One byte for the evaluated examples and one for the covered ones.
+        self.assertEqual(cache.size, 2)
+
+    def test_shared_evaluated_examples(self):
+        cache = CoverageCache()
+        examples = ["cancer(%d)" % i for i in range(16)]
+        cache.store("cancer(A):-smokes(A)", examples, examples[:1])
+        cache.store("cancer(A):-friends(A,B)", examples, examples[8:9])
+        self.assertEqual(len(cache.evaluated), 1)
+        self.assertEqual(cache.size, 2 + 1 + 2)
+        self.assertEqual(
+            cache.lookup("cancer(A):-friends(A,B)", examples[7:10]),
+            (["cancer(8)"], []),
+        )
+
+    def test_eviction(self):
+        # Entries take one byte for their evaluated examples and one for
+        # the examples they cover, if any.
+        cache = CoverageCache(maxSize=3)
+        cache.store("cancer(A):-smokes(A)", ["cancer(alice)"], ["cancer(alice)"])
+        cache.store("cancer(A):-friends(A,B)", ["cancer(bob)"], [])
+        cache.lookup("cancer(A):-smokes(A)", [])
+        cache.store("cancer(A):-friends(B,A)", ["cancer(carl)"], [])
+        self.assertEqual(
+            list(cache.entries),
+            ["cancer(V0):-smokes(V0)", "cancer(V0):-friends(V1,V0)"],
+        )
+        self.assertEqual(cache.size, 3)
+
+    def test_coverage_cached(self):
+        data = Data()
+        data.setFacts(["smokes(bob)", "smokes(dan)"])
+        examples = ["cancer(alice)", "cancer(bob)", "cancer(dan)"]
+
+        self.assertEqual(
+            Logic.coverage(data, "cancer(A):-smokes(A)", examples[:2]),
+            ["cancer(bob)"],
+        )
+        cache = data.knowledgeBase.coverageCache
+        self.assertEqual(
+            cache.lookup("cancer(A):-smokes(A)", examples),
+            (["cancer(bob)"], ["cancer(dan)"]),
+        )
+        self.assertEqual(
+            Logic.coverage(data, "cancer(B):-smokes(B)", examples),
+            ["cancer(bob)", "cancer(dan)"],
+        )
+        self.assertEqual(
+            cache.lookup("cancer(A):-smokes(A)", examples),
+            (["cancer(bob)", "cancer(dan)"], []),
+        )
+
+
+class GenerateTestsTest(unittest.TestCase):
+    """
+    Tests for rfgb.logic.Logic.generateTests
+    """
+
+    def setUp(self):
+        self.background = [
+            "friends(+person,-person)",
+            "friends(-person,+person)",
+            "friends(+person,+person)",
+            "livesin(+person,-city)",
+            "smokes(+person)",
+            "cancer(+person)",
+        ]
+        self.data = Data()
+        self.data.setBackground(self.background)
+        self.data.setTarget(self.background, "cancer")
+        Utils.data = self.data
+        Logic.testCache.clear()
+
+    def generate(self, clause):
+        tests = []
+        for literalName, literalTypeSpecification in self.data.getLiterals():
+            tests += Logic.generateTests(literalName, literalTypeSpecification, clause)
+        return tests
+
+    def test_generate_tests(self):
+        self.assertEqual(self.data.getTarget(), "cancer(A)")
+        self.assertEqual(
+            self.generate("cancer(A):-"),
+            [
+                "friends(A,B)",
+                "friends(B,A)",
+                "friends(A,A)",
+                "livesin(A,B)",
+                "smokes(A)",
+                "cancer(A)",
+            ],
+        )
+
+    def test_new_variables_keep_their_type(self):
+        Utils.addVariableTypes("friends(A,B)")
+        self.assertEqual(
+            self.generate("cancer(A):-friends(A,B);"),
+            [
+                "friends(A,C)",
+                "friends(B,C)",
+                "friends(C,A)",
+                "friends(C,B)",
+                "friends(A,A)",
+                "friends(A,B)",
+                "friends(B,A)",
+                "friends(B,B)",
+                "livesin(A,C)",
+                "livesin(B,C)",
+                "smokes(A)",
+                "smokes(B)",
+                "cancer(A)",
+                "cancer(B)",
+            ],
+        )
+        # B is a person, so the city is named C.
+        self.assertEqual(self.generate("cancer(A):-")[3], "livesin(A,C)")
+
+    def test_generate_tests_cached(self):
+        first = self.generate("cancer(A):-")
+        self.assertTrue(Logic.testCache)
+        self.assertEqual(self.generate("cancer(A):-"), first)
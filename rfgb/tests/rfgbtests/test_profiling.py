@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017-2019 rfgb Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (at the base of this repository). If not,
+# see <http://www.gnu.org/licenses/>
+
+from __future__ import print_function
+from __future__ import absolute_import
+from ...logic import Logic
+from ...logic import Prover
+from ...profiling import Profiler
+from ...utils import Data
+import unittest
+
+
+class ProfilerTest(unittest.TestCase):
+    """
+    Tests for rfgb.profiling.Profiler
+    """
+
+    def tearDown(self):
+        Profiler.disable()
+        Profiler.reset()
+
+    def test_disabled(self):
+        Profiler.reset()
+        Profiler.count("proofs")
+        with Profiler.timer("tree"):
+            pass
+        self.assertEqual(Profiler.counters, {})
+        self.assertEqual(Profiler.timers, {})
+
+    def test_enabled(self):
+        Profiler.enable()
+        Profiler.count("proofs")
+        Profiler.count("proofs", 2)
+        for _ in range(3):
+            with Profiler.timer("tree"):
+                pass
+
+        report = Profiler.report()
+        self.assertEqual(report["counters"]["proofs"], 3)
+        self.assertEqual(report["counters"]["rowsJoined"], 0)
+        self.assertEqual(report["timers"]["tree"]["count"], 3)
+        self.assertEqual(len(report["timers"]["tree"]["times"]), 3)
+        self.assertTrue(report["timers"]["tree"]["total"] >= 0)
+
+    def test_collect_and_merge(self):
+        self.assertIsNone(Profiler.collect())
+
+        Profiler.enable()
+        Profiler.count("proofs", 2)
+        with Profiler.timer("tree"):
+            pass
+        Profiler.setting("engine", "prover")
+        collected = Profiler.collect()
+        self.assertEqual(Profiler.counters, {})
+        self.assertEqual(Profiler.timers, {})
+
+        Profiler.count("proofs")
+        with Profiler.timer("tree"):
+            pass
+        Profiler.merge(collected)
+        report = Profiler.report()
+        self.assertEqual(report["counters"]["proofs"], 3)
+        self.assertEqual(report["timers"]["tree"]["count"], 2)
+        self.assertEqual(report["settings"], {"engine": "prover"})
+
+    def test_prover_counters(self):
+        data = Data()
+        data.setFacts(["friends(alice,bob)", "smokes(bob)"])
+
+        Profiler.enable()
+        self.assertTrue(
+            Prover.prove(data, "cancer(alice)", "cancer(A):-friends(A,B);smokes(B)")
+        )
+        self.assertEqual(Profiler.counters["proofs"], 1)
+        self.assertEqual(Profiler.counters["goals"], 3)
+        self.assertEqual(Profiler.counters["unifications"], 4)
+
+    def test_join_engine_counters(self):
+        data = Data()
+        data.setFacts(["friends(alice,bob)", "friends(alice,carl)", "smokes(bob)"])
+
+        Profiler.enable()
+        self.assertEqual(
+            Logic.coverage(
+                data, "cancer(A):-friends(A,B),smokes(B)", ["cancer(alice)"]
+            ),
+            ["cancer(alice)"],
+        )
+        report = Profiler.report()
+        self.assertEqual(report["settings"], {"engine": "join"})
+        self.assertEqual(report["counters"]["examplesEvaluated"], 1)
+        self.assertEqual(report["counters"]["joins"], 2)
+        self.assertEqual(report["counters"]["probes"], 3)
+        self.assertEqual(report["counters"]["rowsJoined"], 3)
+        # The prover did no work, which is still reported.
+        self.assertEqual(report["counters"]["proofs"], 0)
+        self.assertEqual(report["counters"]["unifications"], 0)
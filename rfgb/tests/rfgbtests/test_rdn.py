@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017-2019 rfgb Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (at the base of this repository). If not,
+# see <http://www.gnu.org/licenses/>
+
+"""
+Unit tests for rdn.learn
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+from ... import rdn
+from ...profiling import Profiler
+from ...tree import node
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PATH = "testDomains/ToyCancer/train/"
+
+
+class WarmStartTest(unittest.TestCase):
+    def setUp(self):
+        # Learning prints the tests it finds.
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+    def test_warm_start_continues(self):
+        """
+        tests: learn keeps the trees of warm_start and learns the rest.
+        """
+        trees = rdn.learn(["cancer"], numTrees=2, path=PATH, saveJson=False)
+        more = rdn.learn(
+            ["cancer"], numTrees=3, path=PATH, saveJson=False, warm_start=trees
+        )
+        self.assertEqual(len(more["cancer"]), 3)
+        self.assertEqual(more["cancer"][:2], trees["cancer"])
+
+    def test_warm_start_model(self):
+        """
+        tests: learn accepts models loaded with Utils.load.
+        """
+        trees = rdn.learn(["cancer"], numTrees=2, path=PATH, saveJson=False)
+        model = [{"target": "cancer", "trees": 2}, trees["cancer"]]
+        same = rdn.learn(
+            ["cancer"],
+            numTrees=2,
+            path=PATH,
+            saveJson=False,
+            warm_start={"cancer": model},
+        )
+        self.assertEqual(same, trees)
+
+
+class CoverageCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+    def test_cache_does_not_change_trees(self):
+        """
+        tests: the trees learned do not depend on the coverage cache size.
+        """
+        trees = rdn.learn(["cancer"], numTrees=2, path=PATH, saveJson=False)
+        uncached = rdn.learn(
+            ["cancer"], numTrees=2, path=PATH, saveJson=False, coverageCacheSize=0
+        )
+        self.assertEqual(uncached, trees)
+
+
+class ParallelTargetsTest(unittest.TestCase):
+    """
+    Targets learned in parallel are the ones learned one after the other.
+    """
+
+    def setUp(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        # Models are saved under .rfgb/models/ in the working directory.
+        self.path = os.path.abspath("testDomains/TicTacToe/train/") + os.sep
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+    def learn(self, parallelTargets):
+        models = os.path.join(".rfgb", "models")
+        shutil.rmtree(".rfgb", ignore_errors=True)
+        os.makedirs(models)
+        trees = rdn.learn(
+            ["put", "dontput"],
+            numTrees=3,
+            path=self.path,
+            n_jobs=2,
+            parallelTargets=parallelTargets,
+        )
+        saved = {}
+        for target in trees:
+            with open(os.path.join(models, target + ".json")) as f:
+                saved[target] = f.read()
+        return trees, saved
+
+    def test_same_models(self):
+        trees, saved = self.learn(parallelTargets=False)
+        parallelTrees, parallelSaved = self.learn(parallelTargets=True)
+        self.assertEqual(sorted(trees), ["dontput", "put"])
+        self.assertEqual(parallelTrees, trees)
+        self.assertEqual(parallelSaved, saved)
+
+    def test_jobs_restored(self):
+        node.setJobs(3)
+        try:
+            self.learn(parallelTargets=True)
+            self.assertEqual(node.jobs, 3)
+        finally:
+            node.setJobs(1)
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed.")
+class VectorizedTest(unittest.TestCase):
+    """
+    Trees learned with vectorized=True have the same structure, and leaf
+    values equal up to float rounding.
+    """
+
+    def setUp(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+    def assertSameTree(self, tree, expected):
+        self.assertEqual(sorted(tree), sorted(expected))
+        for key in expected:
+            if key == "value":
+                self.assertAlmostEqual(tree[key], expected[key], places=9)
+            elif key in ("true", "false"):
+                self.assertSameTree(tree[key], expected[key])
+            else:
+                self.assertEqual(tree[key], expected[key])
+
+    def assertSameModels(self, target, path, regression=False):
+        expected = rdn.learn(
+            [target], numTrees=3, path=path, regression=regression, saveJson=False
+        )
+        models = rdn.learn(
+            [target],
+            numTrees=3,
+            path=path,
+            regression=regression,
+            saveJson=False,
+            vectorized=True,
+        )
+        self.assertEqual(len(models[target]), len(expected[target]))
+        for tree, expectedTree in zip(models[target], expected[target]):
+            self.assertSameTree(tree, expectedTree)
+
+    def test_classification(self):
+        self.assertSameModels("cancer", PATH)
+
+    def test_regression(self):
+        self.assertSameModels(
+            "medv", "testDomains/BostonHousing/train/", regression=True
+        )
+
+
+class ProfilingTest(unittest.TestCase):
+    """
+    What worker processes profile is part of the profile of learning.
+    """
+
+    def setUp(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        Profiler.disable()
+        Profiler.reset()
+
+    def profile(self, **kwargs):
+        Profiler.enable()
+        rdn.learn(
+            ["put", "dontput"],
+            numTrees=2,
+            path="testDomains/TicTacToe/train/",
+            saveJson=False,
+            **kwargs
+        )
+        return Profiler.report()
+
+    def test_workers_are_profiled(self):
+        expected = self.profile()
+        self.assertTrue(expected["counters"]["examplesEvaluated"] > 0)
+        for kwargs in [{"n_jobs": 2}, {"n_jobs": 2, "parallelTargets": True}]:
+            report = self.profile(**kwargs)
+            for name in ["examplesEvaluated", "coverages", "testsScored"]:
+                self.assertEqual(report["counters"][name], expected["counters"][name])
+            self.assertEqual(report["timers"]["tree"]["count"], 4)
+            self.assertEqual(report["settings"], {"engine": "join"})
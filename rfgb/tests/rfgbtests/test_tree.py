@@ -18,9 +18,22 @@
 
 from __future__ import print_function
 from __future__ import absolute_import
+from ...logic import KnowledgeBase
+from ...tree import _coverTests
+from ...tree import _pack
 from ...tree import node
+from ...tree import SplitStatistics
+from ...tree import ExampleIndex
+from ... import utils
+from ...utils import Data
+from ...utils import Utils
 import unittest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class TreeTest(unittest.TestCase):
     def test_setNodeDepth(self):
@@ -36,3 +49,313 @@ class TreeTest(unittest.TestCase):
 
         node.setMaxDepth(100)
         self.assertEqual(node.maxDepth, 100)
+
+
+class CoverTestsTest(unittest.TestCase):
+    """
+    Scoring tests in worker processes should give the same coverage as
+    scoring them in this one.
+    """
+
+    def setUp(self):
+        self.data = Data()
+        self.data.setFacts(
+            [
+                "friends(alice,bob)",
+                "friends(bob,carl)",
+                "friends(carl,alice)",
+                "smokes(bob)",
+                "smokes(carl)",
+            ]
+        )
+        self.examples = ["cancer(alice)", "cancer(bob)", "cancer(carl)"]
+        self.data.setPos(self.examples, "cancer")
+        # Nothing is cached, so that every test is covered by the workers.
+        self.data.knowledgeBase = KnowledgeBase(
+            self.data.getFacts(), coverageCacheSize=0
+        )
+
+    def test_cover_tests_parallel(self):
+        data = self.data
+        node.initTree(data)
+        root = node.expandQueue.pop()
+        tests = ["smokes(A)", "friends(A,B)", "friends(B,A)", "friends(A,bob)"]
+
+        serial = list(root.coverTests("cancer(A):-", tests, data))
+
+        node.setJobs(2)
+        node.startPool(data)
+        try:
+            parallel = list(root.coverTests("cancer(A):-", tests, data))
+        finally:
+            node.closePool()
+            node.setJobs(1)
+
+        self.assertEqual(serial, parallel)
+        self.assertEqual(serial[0], ("smokes(A)", ["cancer(bob)", "cancer(carl)"]))
+
+    def test_worker_pack_is_reused(self):
+        node.poolData = self.data
+        node.poolIndex = ExampleIndex(self.examples)
+        bits = node.poolIndex.bits(self.examples[1:])
+        try:
+            first, profile = _coverTests(
+                ("cancer(A):-friends(A,B);", ["smokes(B)"], bits)
+            )
+            pack = _pack[("cancer(A):-friends(A,B);", bits)][1]
+            second, _ = _coverTests(
+                ("cancer(A):-friends(A,B);", ["friends(A,B)"], bits)
+            )
+            self.assertIs(_pack[("cancer(A):-friends(A,B);", bits)][1], pack)
+        finally:
+            node.poolData = None
+            node.poolIndex = None
+            _pack.clear()
+        # Positions of the examples covered in the pool index.
+        self.assertEqual(first, [[1]])
+        self.assertEqual(second, [[1, 2]])
+        # Nothing is profiled while profiling is disabled.
+        self.assertIsNone(profile)
+
+
+class LeafValuesTest(unittest.TestCase):
+    """
+    The leaf each example ends up in is recorded while learning.
+    """
+
+    def test_leaf_values(self):
+        data = Data()
+        data.setFacts(["smokes(alice)", "smokes(bob)"])
+        data.setPos(["cancer(alice)", "cancer(bob)", "cancer(carl)"], "cancer")
+        data.setNeg(["cancer(dave)"], "cancer")
+        data.target = "cancer(A)"
+        data.pos = {"cancer(alice)": 0.5, "cancer(bob)": 0.5, "cancer(carl)": 0.25}
+        data.neg = {"cancer(dave)": -0.5}
+        Utils.data = data
+
+        node.setMaxDepth(1)
+        node.initTree(data)
+        root = node.expandQueue.pop()
+        root.test = "smokes(A)"
+        root.tree["test"] = "smokes(A)"
+        left = node(
+            examples=["cancer(alice)", "cancer(bob)"],
+            information=0,
+            level=1,
+            parent=root,
+            pos="left",
+        )
+        right = node(
+            examples=["cancer(carl)", "cancer(dave)"],
+            information=1,
+            level=1,
+            parent=root,
+            pos="right",
+        )
+        left.expandOnBestTest(data)
+        right.expandOnBestTest(data)
+
+        self.assertEqual(
+            node.learnedDecisionTree,
+            {
+                "head": "cancer(A)",
+                "test": "smokes(A)",
+                "true": {"value": 0.5},
+                "false": {"value": -0.125},
+            },
+        )
+        self.assertEqual(
+            node.leafValues,
+            {
+                "cancer(alice)": 0.5,
+                "cancer(bob)": 0.5,
+                "cancer(carl)": -0.125,
+                "cancer(dave)": -0.125,
+            },
+        )
+
+
+class LearnTreeTest(unittest.TestCase):
+    """
+    Trees are learned as nested dictionaries, and inferring them gives each
+    example the value of the leaf it ended up in while learning.
+    """
+
+    def test_learn_tree(self):
+        from ...boosting import inferTreeValues
+
+        data = Utils.readTrainingData("cancer", path="testDomains/ToyCancer/train/")
+        node.setMaxDepth(2)
+        node.learnTree(data)
+        tree = node.learnedDecisionTree
+
+        self.assertEqual(tree["head"], "cancer(A)")
+        self.assertIn("test", tree)
+        self.assertIn("value", tree)
+
+        values = inferTreeValues(tree, data.getExamples(), data)
+        self.assertEqual(values, node.leafValues)
+
+    def test_missing_branch(self):
+        """
+        Examples going to a branch no example went to while learning get
+        the value of the node above it.
+        """
+        from ...boosting import inferTreeValues
+
+        data = Data()
+        data.setFacts(["smokes(alice)"])
+        tree = {
+            "head": "cancer(A)",
+            "test": "smokes(A)",
+            "value": 0.25,
+            "true": {"value": 0.5},
+        }
+        self.assertEqual(
+            inferTreeValues(tree, ["cancer(alice)", "cancer(bob)"], data),
+            {"cancer(alice)": 0.5, "cancer(bob)": 0.25},
+        )
+
+
+class SplitStatisticsTest(unittest.TestCase):
+    """
+    The weighted variance of a split, from the statistics of its true side.
+    """
+
+    def test_score(self):
+        data = Data()
+        data.regression = True
+        data.examples = {"a(x)": 1.0, "a(y)": 2.0, "a(z)": 4.0, "a(w)": 5.0}
+        examples = ["a(x)", "a(y)", "a(z)", "a(w)"]
+        statistics = SplitStatistics(data, examples)
+
+        for tExamples in [[], ["a(x)"], ["a(x)", "a(y)"], ["a(y)", "a(w)"]]:
+            fExamples = [example for example in examples if example not in tExamples]
+            expected = (len(tExamples) / 4.0) * data.variance(tExamples) + (
+                len(fExamples) / 4.0
+            ) * data.variance(fExamples)
+            self.assertAlmostEqual(
+                statistics.score(statistics.indices(tExamples)), expected
+            )
+
+        self.assertAlmostEqual(statistics.score(statistics.indices(examples)), 2.5)
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed.")
+    def test_arrays(self):
+        data = Data(regression=True)
+        data.setExamples(["a(x) 1.0", "a(y) 2.0", "a(z) 4.0", "a(w) 5.0"], "a")
+        examples = ["a(w)", "a(x)", "a(z)"]
+        expected = SplitStatistics(data, examples)
+
+        data.useArrays()
+        statistics = SplitStatistics(data, examples)
+        self.assertEqual(list(statistics.values), [5.0, 1.0, 4.0])
+        self.assertAlmostEqual(statistics.total, expected.total)
+        self.assertAlmostEqual(statistics.totalOfSquares, expected.totalOfSquares)
+        for tExamples in [[], ["a(x)"], ["a(w)", "a(z)"]]:
+            self.assertAlmostEqual(
+                statistics.score(statistics.indices(tExamples)),
+                expected.score(expected.indices(tExamples)),
+            )
+
+
+class ExampleIndexTest(unittest.TestCase):
+    """
+    Sets of examples as bitsets over the examples at the root.
+    """
+
+    def test_bits(self):
+        index = ExampleIndex(["a(%d)" % i for i in range(20)])
+        self.assertEqual(index.bits([]), 0)
+        self.assertEqual(index.bits(["a(0)", "a(2)"]), 0b101)
+        self.assertEqual(index.bits(["a(19)", "a(9)"]), (1 << 19) | (1 << 9))
+        self.assertEqual(index.bits(["b(0)"]), 1 << 20)
+        self.assertEqual(index.examples[20], "b(0)")
+
+    def test_members(self):
+        index = ExampleIndex(["a(%d)" % i for i in range(20)])
+        examples = ["a(17)", "a(3)", "a(0)", "a(8)"]
+        bits = index.bits(examples)
+        self.assertEqual(index.members(bits), ["a(0)", "a(3)", "a(8)", "a(17)"])
+        self.assertEqual(index.members(0), [])
+        self.assertEqual(ExampleIndex.count(bits), 4)
+
+        covered = index.bits(["a(3)", "a(4)", "a(17)"])
+        self.assertEqual(index.members(bits & covered), ["a(3)", "a(17)"])
+        self.assertEqual(index.members(bits & ~covered), ["a(0)", "a(8)"])
+
+    def test_without_numpy(self):
+        """
+        Bitsets built and read without NumPy are the ones built and read with
+        it, when it is installed.
+        """
+        index = ExampleIndex(["a(%d)" % i for i in range(100)])
+        sets = [[], ["a(0)"], ["a(7)", "a(8)"], ["a(99)", "a(3)", "a(64)", "a(15)"]]
+        expected = [index.bits(examples) for examples in sets]
+        positions = [ExampleIndex.indices(bits) for bits in expected]
+
+        saved = utils.numpy
+        utils.numpy = None
+        try:
+            self.assertEqual([index.bits(examples) for examples in sets], expected)
+            self.assertEqual(
+                [ExampleIndex.indices(bits) for bits in expected], positions
+            )
+        finally:
+            utils.numpy = saved
+        self.assertEqual(positions[3], [3, 15, 64, 99])
+        self.assertEqual(expected[2], (1 << 7) | (1 << 8))
+
+
+class CandidateTestsTest(unittest.TestCase):
+    """
+    Candidate tests are streamed without duplicates, and can be capped.
+    """
+
+    def setUp(self):
+        background = [
+            "friends(+person,-person)",
+            "friends(-person,+person)",
+            "smokes(+person)",
+            "cancer(person)",
+        ]
+        self.data = Data()
+        self.data.setBackground(background)
+        self.data.setTarget(background, "cancer")
+        Utils.data = self.data
+
+    def test_candidate_tests(self):
+        tests = node.candidateTests("cancer(A):-", self.data)
+        self.assertFalse(isinstance(tests, list))
+        self.assertEqual(
+            list(tests), ["friends(A,B)", "friends(B,A)", "smokes(A)"]
+        )
+        self.assertEqual(
+            list(node.candidateTests("cancer(A):-", self.data, ["smokes(A)"])),
+            ["friends(A,B)", "friends(B,A)"],
+        )
+
+    def test_max_tests(self):
+        self.data.setFacts(["smokes(alice)"])
+        self.data.setPos(["cancer(alice)"], "cancer")
+        self.data.setNeg(["cancer(bob)"], "cancer")
+
+        node.setMaxTests(2)
+        try:
+            node.initTree(self.data)
+            root = node.expandQueue.pop()
+            scored = []
+            coverTests = root.coverTests
+
+            def recordTests(clause, tests, data):
+                for test, covered in coverTests(clause, tests, data):
+                    scored.append(test)
+                    yield test, covered
+
+            root.coverTests = recordTests
+            root.expandOnBestTest(self.data)
+        finally:
+            node.setMaxTests(None)
+
+        self.assertEqual(len(scored), 2)
+        self.assertIn(root.test, scored)
@@ -25,9 +25,18 @@ Tests should be ordered in the same manner as they are defined in Utils.py
 
 from __future__ import absolute_import
 from ...utils import Data
+from ...utils import ModelWriter
 from ...utils import Utils
+import os
+import shutil
+import tempfile
 import unittest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class UtilsTest(unittest.TestCase):
     def test_sigmoid(self):
@@ -280,3 +289,110 @@ class UtilsTest(unittest.TestCase):
                 "medv(id10)": 18.9,
             },
         )
+
+    def test_cartesianProduct(self):
+        """
+        tests: Utils.cartesianProduct
+        """
+        self.assertEqual(
+            Utils.cartesianProduct([["A"], ["B", "C"], ["x", "y"]]),
+            [
+                ["A", "B", "x"],
+                ["A", "B", "y"],
+                ["A", "C", "x"],
+                ["A", "C", "y"],
+            ],
+        )
+
+    def test_reservoirSample(self):
+        """
+        tests: Utils.reservoirSample
+        """
+        self.assertEqual(Utils.reservoirSample(iter(range(3)), 5), [0, 1, 2])
+        for _ in range(20):
+            sample = Utils.reservoirSample(iter(range(100)), 10)
+            self.assertEqual(len(sample), 10)
+            self.assertEqual(len(set(sample)), 10)
+            self.assertEqual(sample, sorted(sample))
+
+
+class ModelWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.location = os.path.join(self.path, "cancer.json")
+        self.params = {"target": "cancer", "regression": False}
+        self.trees = [
+            ["cancer(A) :- smokes(A) 0.8", "cancer(A) :- 0.1"],
+            ["cancer(A) :- friends(A,B) 0.3", "cancer(A) :- -0.2"],
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_append_and_load(self):
+        """
+        tests: ModelWriter.append, Utils.load
+        """
+        writer = ModelWriter(self.location, self.params)
+        for tree in self.trees:
+            writer.append(tree)
+        writer.close()
+
+        with open(self.location) as f:
+            self.assertEqual(len(f.read().splitlines()), 3)
+
+        params, trees = Utils.load(self.location)
+        self.assertEqual(trees, self.trees)
+        self.assertEqual(params["target"], "cancer")
+        self.assertEqual(params["trees"], 2)
+
+    def test_load_truncated(self):
+        """
+        tests: Utils.load leaves out a tree that was cut off.
+        """
+        writer = ModelWriter(self.location, self.params)
+        for tree in self.trees:
+            writer.append(tree)
+        writer.close()
+
+        with open(self.location) as f:
+            content = f.read()
+        with open(self.location, "w") as f:
+            f.write(content[:-10])
+
+        params, trees = Utils.load(self.location)
+        self.assertEqual(trees, self.trees[:1])
+        self.assertEqual(params["trees"], 1)
+
+    def test_load_saved(self):
+        """
+        tests: Utils.load reads models written by Utils.save.
+        """
+        self.params["trees"] = 2
+        Utils.save(self.location, [self.params, self.trees])
+        self.assertEqual(Utils.load(self.location), [self.params, self.trees])
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed.")
+class UseArraysTest(unittest.TestCase):
+    def test_views(self):
+        """
+        tests: Data.useArrays keeps pos and neg usable as dictionaries.
+        """
+        data = Utils.readTrainingData("cancer", path="testDomains/ToyCancer/train/")
+        examples = data.getExamples()
+        pos, neg = dict(data.pos), dict(data.neg)
+
+        data.useArrays()
+        self.assertEqual(data.getExamples(), examples)
+        self.assertEqual(dict(data.pos), pos)
+        self.assertEqual(dict(data.neg), neg)
+        self.assertEqual(list(data.arrays.labels).count(1.0), len(pos))
+
+        example = next(iter(pos))
+        data.pos[example] = 0.25
+        self.assertEqual(data.getValue(example), 0.25)
+        self.assertEqual(data.arrays.values[data.arrays.index[example]], 0.25)
+
+        with self.assertRaises(KeyError):
+            data.pos["cancer(nobody)"] = 1.0
@@ -24,29 +24,186 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
 
+from .utils import ExampleIndex
 from .utils import Utils
 from .logic import Logic
 from .logic import Prover
+from .logic import QueryPack
+from .profiling import Profiler
 
 from copy import deepcopy
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-class node:
+
+# Examples and QueryPack of the node whose tests a worker process is
+# covering, keyed by the clause and the bitset of the examples of the node.
+_pack = {}
+
+
+def _coverTests(task):
+    """
+    Runs in a worker process: returns, for each test, the positions (in
+    node.poolIndex) of the examples covered by the clause with the test
+    conjoined.
+
+    The examples at the node come as a bitset over node.poolIndex, and each
+    worker builds the QueryPack of the node once, however many chunks of
+    its tests it covers. What the worker profiled (counts inherited from
+    the parent excluded) is returned with the coverages.
+    """
+    Profiler.reset()
+    clause, tests, bits = task
+    key = (clause, bits)
+    if key not in _pack:
+        _pack.clear()
+        examples = node.poolIndex.members(bits)
+        _pack[key] = examples, QueryPack(node.poolData, clause, examples)
+    examples, pack = _pack[key]
+
+    positions = node.poolIndex.positions
+    coverages = []
+    for test in tests:
+        covered = Logic.coverage(
+            node.poolData, node.testClause(clause, test), examples, pack
+        )
+        coverages.append([positions[example] for example in covered])
+    return coverages, Profiler.collect()
+
+
+def _merged(results):
+    """
+    Yields the coverages returned by :func:`_coverTests`, merging what each
+    worker profiled into the profile of this process.
+    """
+    for coverages, collected in results:
+        Profiler.merge(collected)
+        yield coverages
+
+
+class SplitStatistics(object):
+    """
+    Count, sum and sum of squares of the regression values of the examples
+    at a node. The weighted variance of any split of these examples is
+    computed from the statistics of the examples on its true side, and the
+    statistics of its false side are what remains of the node's.
+
+    The values are kept in a NumPy array when NumPy is installed, and in a
+    list otherwise. When the values of data are stored in arrays (see
+    :meth:`.Data.useArrays`), they are gathered from them by position.
+    """
+
+    def __init__(self, data, examples):
+        """
+        :param data: Data with the regression values of the examples.
+        :type data: :py:class:`.utils.Data`
+
+        :param examples: Examples at the node.
+        :type examples: list of str.
+        """
+        self.examples = list(examples)
+        self.positions = dict((e, i) for i, e in enumerate(self.examples))
+        if data.arrays is not None:
+            self.values = data.arrays.values[data.arrays.positions(self.examples)]
+            self.squares = self.values * self.values
+        elif numpy is not None:
+            self.values = numpy.array(
+                [data.getValue(example) for example in self.examples], dtype=float
+            )
+            self.squares = self.values * self.values
+        else:
+            self.values = [data.getValue(example) for example in self.examples]
+            self.squares = [value * value for value in self.values]
+        self.count = len(self.examples)
+        self.total = float(sum(self.values))
+        self.totalOfSquares = float(sum(self.squares))
+
+    def indices(self, examples):
+        """
+        Returns the positions of examples among the examples at the node.
+        """
+        return [self.positions[example] for example in examples]
+
+    def statistics(self, indices):
+        """
+        Returns the count, sum and sum of squares of the values at indices.
+        """
+        if not indices:
+            return 0, 0.0, 0.0
+        if numpy is not None:
+            indices = numpy.array(indices)
+            return (
+                len(indices),
+                float(self.values[indices].sum()),
+                float(self.squares[indices].sum()),
+            )
+        values, squares = self.values, self.squares
+        return (
+            len(indices),
+            sum(values[i] for i in indices),
+            sum(squares[i] for i in indices),
+        )
+
+    @staticmethod
+    def sumOfSquaredErrors(count, total, totalOfSquares):
+        """
+        Returns the sum of squared errors (variance times count) of values
+        with the given count, sum and sum of squares.
+        """
+        if not count:
+            return 0.0
+        return max(totalOfSquares - total * total / count, 0.0)
+
+    def score(self, indices):
+        """
+        Returns the weighted variance of the split whose true side is the
+        examples at indices.
+        """
+        count, total, totalOfSquares = self.statistics(indices)
+        return (
+            SplitStatistics.sumOfSquaredErrors(count, total, totalOfSquares)
+            + SplitStatistics.sumOfSquaredErrors(
+                self.count - count,
+                self.total - total,
+                self.totalOfSquares - totalOfSquares,
+            )
+        ) / self.count
+
+
+class node(object):
     """
     A node in a tree.
 
     :param expandQueue: Breadth first search node expansion strategy
     :param depth: initial depth is 0 because no node present
     :param maxDepth: max depth set to 1 because we want to at least learn a tree of depth 1
-    :param learnedDecisionTree: this will hold all the clauses learned
+    :param learnedDecisionTree: the tree learned, as nested dictionaries (see
+                                :meth:`.node.learnTree`)
     :param data: stores all the facts, positive and negative examples
+    :param leafValues: value of the leaf each example ended up in
+    :param exampleIndex: positions of the examples of the tree being learned
+    :param maxTests: maximum number of candidate tests scored at a node
+    :param jobs: number of processes used to score candidate tests
+    :param pool: worker processes (forked from the data in poolData)
+    :param poolIndex: positions of the examples of poolData, shared with the
+                      worker processes
     """
 
     expandQueue = []
     depth = 0
     maxDepth = 1
     learnedDecisionTree = []
+    leafValues = {}
+    exampleIndex = ExampleIndex()
     data = None
+    maxTests = None
+    jobs = 1
+    pool = None
+    poolData = None
+    poolIndex = None
 
     def __init__(
         self,
@@ -56,6 +213,7 @@ class node:
         level=None,
         parent=None,
         pos=None,
+        bits=None,
     ):
         """
         Constructor for node class.
@@ -66,6 +224,8 @@ class node:
         :param level: Level of this node in the tree (0 for root).
         :param parent: "root", or a pointer to the parent.
         :param pos: Position in the tree ('left' or 'right')
+        :param bits: Examples at this node as a bitset over
+                     node.exampleIndex, instead of a list of examples.
         """
         self.test = test
         if level > 0:
@@ -73,15 +233,29 @@ class node:
         else:
             self.parent = "root"
         self.pos = pos
-        self.examples = examples
+        if bits is None:
+            bits = node.exampleIndex.bits(examples or [])
+        self.bits = bits
         self.information = information
         self.level = level
         self.left = None
         self.right = None
 
+        # This node in the learned tree, linked from its parent's.
+        self.tree = {}
+        if self.parent != "root":
+            self.parent.tree["true" if pos == "left" else "false"] = self.tree
+
         # Add to the queue of nodes to expand.
         node.expandQueue.insert(0, self)
 
+    @property
+    def examples(self):
+        """
+        Examples available for testing at this node.
+        """
+        return node.exampleIndex.members(self.bits)
+
     @staticmethod
     def setMaxDepth(depth):
         """
@@ -90,9 +264,61 @@ class node:
         node.maxDepth = depth
 
     @staticmethod
-    def initTree(trainingData):
+    def setMaxTests(maxTests):
+        """
+        Set the maximum number of candidate tests scored at a node. Nodes with
+        more candidates score a uniform random sample of them. None scores
+        every candidate.
+        """
+        node.maxTests = maxTests
+
+    @staticmethod
+    def setJobs(jobs):
+        """
+        Set the number of processes used to score candidate tests. With more
+        than one, tests are scored by forked worker processes, and the tree
+        learned is the same as with one.
+        """
+        node.jobs = jobs
+
+    @staticmethod
+    def startPool(data):
+        """
+        Start node.jobs worker processes for scoring tests on data, unless
+        they have already been started for it.
+
+        The knowledge base of data is compiled first, so the workers share it
+        with this process instead of each compiling their own, and so is an
+        index of the examples of data, so that the examples at a node are
+        sent to the workers as a bitset.
+        """
+        if node.pool is not None and node.poolData is data:
+            return
+        node.closePool()
+        Prover.getKnowledgeBase(data)
+        node.poolData = data
+        node.poolIndex = ExampleIndex(data.getExamples())
+        node.pool = Utils.forkPool(node.jobs)
+
+    @staticmethod
+    def closePool():
+        """
+        Stop the worker processes, if there are any.
+        """
+        if node.pool is not None:
+            node.pool.close()
+            node.pool.join()
+        node.pool = None
+        node.poolData = None
+        node.poolIndex = None
+
+    @staticmethod
+    def initTree(trainingData, examples=None):
         """
         Create the root node of the tree.
+
+        :param examples: Examples to learn the tree from, all the examples
+                         in trainingData by default.
         """
 
         node.data = trainingData
@@ -101,48 +327,74 @@ class node:
         node.expandQueue = []
         # Reset clauses for every tree to be learned.
         node.learnedDecisionTree = []
+        # Reset the leaf of each example for every tree to be learned.
+        node.leafValues = {}
 
-        if trainingData.regression:
-            # Regression examples can be collected from trainingData.examples
-            # (since there are no pos/neg).
-            examples = trainingData.examples.keys()
-        else:
-            # For all other models, we consider a set of positive and
-            # negative examples.
-            examples = list(trainingData.pos.keys()) + list(trainingData.neg.keys())
+        # Regression examples are collected from trainingData.examples (since
+        # there are no pos/neg), for all other models we consider a set of
+        # positive and negative examples.
+        if examples is None:
+            examples = trainingData.getExamples()
+        node.exampleIndex = ExampleIndex(examples)
 
-        node(
+        root = node(
             test=None,
             examples=examples,
             information=trainingData.variance(examples),
             level=0,
             parent="root",
         )
+        root.tree["head"] = trainingData.getTarget()
+        node.learnedDecisionTree = root.tree
 
     @staticmethod
-    def learnTree(data):
+    def learnTree(data, examples=None):
         """
         Method to create and learn the decision tree.
+
+        The tree learned (:attr:`.node.learnedDecisionTree`) is a dictionary
+        with the head of its clauses (``'head'``), the test at the root
+        (``'test'``), the subtrees of the examples which satisfy it or not
+        (``'true'`` and ``'false'``, missing if no example went that way),
+        and the mean value of the examples at the root (``'value'``).
+        Subtrees have the same keys but ``'head'``, and leaves only have a
+        ``'value'``. The test of a node is proved conjoined to the tests of
+        its ancestors on the ``'true'`` side.
+
+        .. code-block:: python
+
+                        {'head': 'cancer(A)',
+                         'test': 'smokes(A)',
+                         'value': 0.1,
+                         'true': {'value': 0.8},
+                         'false': {'test': 'friends(A,B)',
+                                   'value': -0.2,
+                                   'true': {'value': 0.3},
+                                   'false': {'value': -0.4}}}
+
+        :param examples: Examples to learn the tree from (for instance a
+                         sample of them, see :func:`.boosting.sampleExamples`),
+                         all the examples in data by default.
         """
 
         # Create the root
-        node.initTree(data)
+        node.initTree(data, examples)
+
+        if node.jobs > 1:
+            node.startPool(data)
 
         while len(node.expandQueue) > 0:
             current = node.expandQueue.pop()
-            current.expandOnBestTest(data)
-
-        node.learnedDecisionTree.sort(key=lambda x: len(x.split(" ")[0]))
-        node.learnedDecisionTree = node.learnedDecisionTree[::-1]
+            with Profiler.timer("node"):
+                current.expandOnBestTest(data)
 
-    def getTrueExamples(self, clause, test, data):
+    @staticmethod
+    def testClause(clause, test):
         """
-        Returns all examples that satisfy the clause
-        with conjoined test literal.
+        Returns the clause with the test literal conjoined, in the form used
+        by the prover.
         """
 
-        # Initialize a list of true examples.
-        trueExamples = []
         clauseCopy = deepcopy(clause)
 
         # Construct clause for prover
@@ -150,13 +402,102 @@ class node:
             clauseCopy += test
         elif clauseCopy[-1] == ";":
             clauseCopy = clauseCopy.replace(";", ",") + test
+        return clauseCopy
+
+    def getTrueExamples(self, clause, test, data):
+        """
+        Returns all examples that satisfy the clause
+        with conjoined test literal.
+        """
 
-        # Prove if example satisfies clause.
-        for example in self.examples:
-            if Prover.prove(data, example, clauseCopy):
-                trueExamples.append(example)
+        # Collect the examples which satisfy the clause.
+        trueExamples = Logic.coverage(
+            data, node.testClause(clause, test), self.examples
+        )
         return trueExamples
 
+    def coverTests(self, clause, tests, data):
+        """
+        Yields each test with the result of :meth:`.node.getTrueExamples`
+        for it, in order. Tests can be any iterable, and are covered as they
+        come. When worker processes are running for data, the tests are
+        split into chunks which are covered in parallel.
+
+        The bindings of clause for the examples at this node are computed
+        once (see :py:class:`.logic.QueryPack`), and each test is only
+        joined with them. Worker processes compute them once per node too.
+        """
+
+        examples = self.examples
+        poolIndex = node.poolIndex
+        if (
+            node.pool is None
+            or node.poolData is not data
+            or not all(example in poolIndex.positions for example in examples)
+        ):
+            pack = QueryPack(data, clause, examples)
+            for test in tests:
+                yield test, Logic.coverage(
+                    data, node.testClause(clause, test), examples, pack
+                )
+            return
+
+        # Only the tests whose coverage is not cached are sent to the
+        # workers, and their coverage is cached here when it comes back.
+        tests = list(tests)
+        cache = Prover.getKnowledgeBase(data).coverageCache
+        cached = []
+        pending = []
+        for test in tests:
+            known, missing = cache.lookup(node.testClause(clause, test), examples)
+            cached.append(None if missing else known)
+            if missing:
+                pending.append(test)
+        # Coverages computed by the workers are counted there.
+        Profiler.count("coverages", len(tests) - len(pending))
+        Profiler.count("coveragesCached", len(tests) - len(pending))
+
+        bits = poolIndex.bits(examples)
+        size = max(1, -(-len(pending) // (4 * node.jobs)))
+        tasks = [
+            (clause, pending[i : i + size], bits)
+            for i in range(0, len(pending), size)
+        ]
+        results = (
+            [poolIndex.examples[i] for i in positions]
+            for coverages in _merged(node.pool.imap(_coverTests, tasks))
+            for positions in coverages
+        )
+        # Covered examples are put back in the order of the examples here.
+        order = node.exampleIndex.positions
+        for test, known in zip(tests, cached):
+            if known is None:
+                known = sorted(next(results), key=order.get)
+                cache.store(node.testClause(clause, test), examples, known)
+            yield test, known
+
+    @staticmethod
+    def candidateTests(clause, data, excluded=()):
+        """
+        Yields the tests for every literal in data that can be conjoined to
+        clause, generated one at a time and without duplicates.
+
+        :param excluded: Tests not to yield (the tests of the ancestors).
+        """
+        seen = set(excluded)
+        # For every literal generate test conditions.
+        for literal in data.getLiterals():
+            literalName = literal[0]
+            literalTypeSpecification = literal[1]
+
+            # Generate all possible literal, variable, and constant combinations
+            for test in Logic.iterateTests(
+                literalName, literalTypeSpecification, clause
+            ):
+                if test not in seen:
+                    seen.add(test)
+                    yield test
+
     def expandOnBestTest(self, data=None):
         """
         Expand the node based on the best test.
@@ -178,16 +519,14 @@ class node:
 
             current = current.parent
 
+        examples = self.examples
+        self.tree["value"] = Utils.getleafValue(examples)
+
         if self.level == node.maxDepth or round(self.information, 3) == 0:
 
-            if clause[-1] != "-":
-                node.learnedDecisionTree.append(
-                    clause[:-1] + " " + str(Utils.getleafValue(self.examples))
-                )
-            else:
-                node.learnedDecisionTree.append(
-                    clause + " " + str(Utils.getleafValue(self.examples))
-                )
+            # Remember which leaf the examples ended up in.
+            for example in examples:
+                node.leafValues[example] = self.tree["value"]
             return
 
         if clause[-2] == "-":
@@ -197,58 +536,54 @@ class node:
         minScore = float("inf")
         bestTest = ""
 
-        # List for best test  examples which satisfy  or do not satisfy clause.
-        bestTExamples, bestFExamples = [], []
-        # Get all the literals contained in the facts.
-        literals = data.getLiterals()
+        # Bitsets of the best test examples which satisfy or do not satisfy
+        # clause.
+        bestTBits, bestFBits = 0, 0
+        # Candidate tests are streamed to the scorer, unless they are
+        # subsampled.
+        tests = node.candidateTests(clause, data, ancestorTests)
+        if node.maxTests is not None:
+            tests = Utils.reservoirSample(tests, node.maxTests)
 
-        tests = []
-        # For every literal generate test conditions.
-        for literal in literals:
-            literalName = literal[0]
-            literalTypeSpecification = literal[1]
-
-            # Generate all possible literal, variable, and constant combinations
-            tests += Logic.generateTests(literalName, literalTypeSpecification, clause)
-
-        if self.parent != "root":
-            tests = [test for test in tests if not test in ancestorTests]
-        tests = set(tests)
+        # Count, sum and sum of squares of the values at this node.
+        statistics = SplitStatistics(data, self.examples)
+        bestTExamples = []
+        scored = 0
 
         # Check which test scores the best.
-        for test in tests:
-            # Examples which are satisfied.
-            tExamples = self.getTrueExamples(clause, test, data)
-            # Examples which are not satisfied (under closed world assumption).
-            fExamples = [
-                example for example in self.examples if example not in tExamples
-            ]
-            # Total number of examples.
-            example_len = len(self.examples)
-
-            # Calculated the weighted variance:
-            score = (len(tExamples) / example_len) * data.variance(tExamples) + (
-                len(fExamples) / example_len
-            ) * data.variance(fExamples)
+        for test, tExamples in self.coverTests(clause, tests, data):
+            # tExamples: examples which are satisfied, the others are not
+            # (under closed world assumption).
+            scored += 1
+
+            # Calculate the weighted variance:
+            score = statistics.score(statistics.indices(tExamples))
 
             if score < minScore:  # if score lower than current lowest
                 minScore = score  # assign new minimum
                 bestTest = test  # assign new best test
                 bestTExamples = tExamples  # collect satisfied examples
-                bestFExamples = fExamples  # collect unsatisfied examples
+        Profiler.count("testsScored", scored)
+        if bestTest:
+            # Split the examples at this node on the coverage of the best test.
+            coveredBits = node.exampleIndex.bits(bestTExamples)
+            bestTBits = self.bits & coveredBits
+            bestFBits = self.bits & ~coveredBits
         Utils.addVariableTypes(bestTest)  # add variable types of new variables
         self.test = bestTest  # assign best test after going through all literal specs
+        if bestTest:
+            self.tree["test"] = bestTest
 
         print("Best test found at the current node: ", self.test)
 
         # If True examples need further explaining,
         # create left node and add to the queue.
-        if len(bestTExamples) > 0:
+        if bestTBits:
 
             self.left = node(
                 test=None,
-                examples=bestTExamples,
-                information=data.variance(bestTExamples),
+                bits=bestTBits,
+                information=data.variance(node.exampleIndex.members(bestTBits)),
                 level=self.level + 1,
                 parent=self,
                 pos="left",
@@ -259,12 +594,12 @@ class node:
 
         # If False examples need further explaining,
         # create right node and add to the queue.
-        if len(bestFExamples) > 0:
+        if bestFBits:
 
             self.right = node(
                 test=None,
-                examples=bestFExamples,
-                information=data.variance(bestFExamples),
+                bits=bestFBits,
+                information=data.variance(node.exampleIndex.members(bestFBits)),
                 level=self.level + 1,
                 parent=self,
                 pos="right",
@@ -273,11 +608,7 @@ class node:
             if self.level + 1 > node.depth:
                 node.depth = self.level + 1
 
-        # If there are no examples, append clause as it is.
-        # if no examples append clause as is
-        if self.test == "" or round(self.information, 3) == 0:
-            if clause[-1] != "-":
-                node.learnedDecisionTree.append(clause[:-1])
-            else:
-                node.learnedDecisionTree.append(clause)
-            return
+        # If no test was found, this node is a leaf.
+        if not bestTest:
+            for example in examples:
+                node.leafValues[example] = self.tree["value"]
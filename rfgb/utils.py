@@ -20,12 +20,33 @@
 (docstring for utils)
 """
 
-from random import sample
+from binascii import hexlify
+from binascii import unhexlify
 from math import exp
 
 import codecs
+import itertools
 import json
+import multiprocessing
+import os
+import random
 import string
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class Data(object):
@@ -40,6 +61,7 @@ class Data(object):
 
         adviceClauses: dictionary of advice clauses.
         facts: list of strings representing facts.
+        knowledgeBase: facts compiled for the prover (built on first use).
         pos: dictionary of positive examples.
         neg: dictionary of negative examples.
         examples: dictionary of examples for regression.
@@ -47,12 +69,15 @@ class Data(object):
         target: Target(s) to be learned or inferred.
         literals: Literals present in facts or their type specifications.
         variableType: Type of variable for facts and target.
+        arrays: :py:class:`.ExampleArrays` holding the values of the
+                examples, once :meth:`.Data.useArrays` has been called.
         """
 
         self.regression = regression
         self.advice = advice
         self.adviceClauses = {}
         self.facts = []
+        self.knowledgeBase = None
         self.pos = {}
         self.neg = {}
         self.examples = {}
@@ -61,6 +86,7 @@ class Data(object):
         self.literals = []
         self.literalTypes = {}
         self.variableType = {}
+        self.arrays = None
 
         self.softm = softm
         self.alpha = alpha
@@ -76,6 +102,7 @@ class Data(object):
         :returns: None
         """
         self.facts = facts
+        self.knowledgeBase = None
 
     def getFacts(self):
         """returns the facts in the data"""
@@ -143,14 +170,14 @@ class Data(object):
                         data.setTarget(background, target)
 
                         print(data.target)
-                        # 'cancer(C)'
+                        # 'cancer(A)'
         """
         # targetTypes are the types of variables in the target predicate.
         targetTypes = [i[:-1].split("(")[1].split(",") for i in bk if target in i][0]
         targetTypes = list(map(Utils.removeModeSymbols, targetTypes))
 
         targetArity = len(targetTypes)
-        targetVariables = sample(Utils.UniqueVariableCollection, targetArity)
+        targetVariables = sorted(Utils.UniqueVariableCollection)[:targetArity]
 
         self.target = target + "("
         for variable in targetVariables:
@@ -164,6 +191,61 @@ class Data(object):
         """
         return self.target
 
+    def getExamples(self):
+        """
+        Returns a list of the examples: positives followed by negatives, or
+        the regression examples.
+        """
+        if self.regression:
+            return list(self.examples)
+        return list(self.pos) + list(self.neg)
+
+    def useArrays(self):
+        """
+        Moves the values of the examples (and their true values, for
+        regression) into NumPy arrays (see :py:class:`.ExampleArrays`), so
+        that :func:`.boosting.updateGradients` updates them all at once.
+        pos, neg, examples and examplesTrueValue become views of the arrays,
+        and can be used as before.
+
+        Examples have to be set first, and cannot be added afterwards.
+
+        Example:
+
+        .. code-block:: python
+
+                        data = Utils.readTrainingData('cancer', path='train/')
+                        data.useArrays()
+
+                        data.arrays.values
+                        # array([ 0.858,  0.858, ..., -0.142])
+                        data.pos['cancer(alice)']
+                        # 0.858...
+        """
+        if numpy is None:
+            raise ImportError(
+                "NumPy is required to store examples in arrays "
+                "(pip install rfgb[numpy])."
+            )
+        if self.arrays is not None:
+            return
+
+        examples = self.getExamples()
+        arrays = ExampleArrays(examples)
+        arrays.values[:] = [self.getValue(example) for example in examples]
+        if self.regression:
+            arrays.trueValues[:] = [
+                self.examplesTrueValue[example] for example in examples
+            ]
+            self.examples = arrays.view(arrays.values)
+            self.examplesTrueValue = arrays.view(arrays.trueValues)
+        else:
+            positives = len(self.pos)
+            arrays.labels[:positives] = 1.0
+            self.pos = arrays.view(arrays.values, examples[:positives])
+            self.neg = arrays.view(arrays.values, examples[positives:])
+        self.arrays = arrays
+
     def getExampleTrueValue(self, example):
         """
         Returns true regression value of an example for regression learning.
@@ -190,6 +272,9 @@ class Data(object):
                         y = trainingData.getValue('cancer(alice)')
                         # y == 0.5, since alice does have cancer
         """
+        if self.arrays is not None:
+            return float(self.arrays.values[self.arrays.index[example]])
+
         if self.regression:
             return self.examples[example]
 
@@ -226,6 +311,9 @@ class Data(object):
         if not examples:
             return 0
 
+        if self.arrays is not None:
+            return float(self.arrays.values[self.arrays.positions(examples)].var())
+
         total = sum([self.getValue(example) for example in examples])
         numberOfExamples = len(examples)
         mean = total / float(numberOfExamples)
@@ -308,11 +396,33 @@ class Utils(object):
         """returns average of regression values for examples"""
         if not examples:
             return 0
+        if Utils.data.arrays is not None:
+            arrays = Utils.data.arrays
+            return float(arrays.values[arrays.positions(examples)].mean())
         total = 0
         for example in examples:
             total += Utils.data.getValue(example)
         return total / float(len(examples))
 
+    @staticmethod
+    def forkPool(processes):
+        """
+        Returns a pool of worker processes forked from this one, so that they
+        share its memory (facts, knowledge bases, ...) copy-on-write. Returns
+        None if processes cannot be forked on this platform.
+
+        :param processes: Number of worker processes.
+        :type processes: int.
+        """
+        if not hasattr(multiprocessing, "get_context"):
+            # Python 2 always forks on posix.
+            if os.name == "posix":
+                return multiprocessing.Pool(processes)
+            return None
+        if "fork" not in multiprocessing.get_all_start_methods():
+            return None
+        return multiprocessing.get_context("fork").Pool(processes)
+
     @staticmethod
     def save(location, saveItem):
         """
@@ -331,13 +441,36 @@ class Utils(object):
         """
         Loads json version of learnedDecisionTree from location.
 
+        Models saved by :class:`.ModelWriter` (a header line followed by one
+        line per tree) are returned as ``[params, trees]``, like models saved
+        by :meth:`.Utils.save`. A last tree cut off while it was being
+        written is left out.
+
         :param location: Name of the file to load.
         :type location: str.
 
-        :returns: None.
+        :returns: The loaded json.
         """
         with codecs.open(location, encoding="utf-8", mode="r") as f:
-            return json.load(f)
+            first = f.readline()
+            if not first.startswith("{"):
+                # A json document, as written by Utils.save.
+                return json.loads(first + f.read())
+
+            header = json.loads(first)
+            if header.get("format") != ModelWriter.FORMAT:
+                return json.loads(first + f.read())
+
+            trees = []
+            for line in f:
+                try:
+                    trees.append(json.loads(line))
+                except ValueError:
+                    break
+
+        params = dict(header["params"])
+        params["trees"] = len(trees)
+        return [params, trees]
 
     @staticmethod
     def readTrainingData(
@@ -348,6 +481,7 @@ class Utils(object):
         softm=False,
         alpha=0.0,
         beta=0.0,
+        facts=None,
     ):
         """
         Reads the training data from files.
@@ -366,6 +500,11 @@ class Utils(object):
                        contained in the same directory as the examples.
         :type advice: bool
 
+        :param facts: Facts which have already been read from ``facts.txt``
+                      (e.g. when learning several targets from the same
+                      facts). They are read from the file when this is None.
+        :type facts: list of str.
+
         :default path: 'train/'
         :default regression: False
         :default advice: False
@@ -411,9 +550,12 @@ class Utils(object):
                         Utils.data.adviceClauses[adviceClause]["nonPreferred"] = []
                         # trainData.adviceClauses[adviceClause]['nonPreferred'] = []
 
-        with open(path + "facts.txt") as fac:
-            Utils.data.setFacts(fac.read().splitlines())
-            # trainData.setFacts(fac.read().splitlines())
+        if facts is not None:
+            Utils.data.setFacts(facts)
+        else:
+            with open(path + "facts.txt") as fac:
+                Utils.data.setFacts(fac.read().splitlines())
+                # trainData.setFacts(fac.read().splitlines())
 
         if regression:
             with open(path + "examples.txt") as exam:
@@ -483,31 +625,316 @@ class Utils(object):
     def cartesianProduct(itemSets):
         """
         Returns the Cartesian Product of all sets contained in the item sets.
+
+        See :meth:`.Logic.iterateTests` for streaming the product instead.
+        """
+        return [list(item) for item in itertools.product(*itemSets)]
+
+    @staticmethod
+    def reservoirSample(items, size):
+        """
+        Returns a uniform random sample of size items from an iterable of
+        unknown length, holding no more than size items in memory. The
+        sample is in the order of the iterable.
+
+        :param items: Items to sample from.
+        :type items: iterable.
+
+        :param size: Number of items to sample.
+        :type size: int.
+        """
+        reservoir = []
+        for i, item in enumerate(items):
+            if i < size:
+                reservoir.append((i, item))
+            else:
+                j = random.randint(0, i)
+                if j < size:
+                    reservoir[j] = (i, item)
+        reservoir.sort(key=lambda entry: entry[0])
+        return [item for _, item in reservoir]
+
+
+class ModelWriter(object):
+    """
+    Saves the trees of a model as they are learned, appending one json line
+    per tree after a header line with the parameters. Lines are written by a
+    background thread, so that learning does not wait on the disk.
+
+    Models are loaded with :meth:`.Utils.load`.
+
+    .. code-block:: python
+
+                    writer = ModelWriter('.rfgb/models/cancer.json', params)
+                    for tree in trees:
+                        writer.append(tree)
+                    writer.close()
+    """
+
+    FORMAT = "rfgb-trees"
+
+    def __init__(self, location, params):
+        """
+        Starts a new model file at location.
+
+        :param location: Name of the file to write.
+        :type location: str.
+
+        :param params: Parameters the trees are learned with.
+        :type params: dict.
+        """
+        self.location = location
+        self.error = None
+        self.lines = queue.Queue()
+        self.file = codecs.open(location, encoding="utf-8", mode="w")
+        self.thread = threading.Thread(target=self._write)
+        self.thread.daemon = True
+        self.thread.start()
+        self.lines.put(json.dumps({"format": ModelWriter.FORMAT, "params": params}))
+
+    def _write(self):
+        """
+        Writes the queued lines until None is queued.
+        """
+        while True:
+            line = self.lines.get()
+            if line is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.file.write(line + "\n")
+                self.file.flush()
+            except (IOError, OSError) as error:
+                self.error = error
+
+    def append(self, tree):
+        """
+        Queues a tree to be written.
+
+        :param tree: The learned tree.
+        :type tree: list.
+        """
+        self.lines.put(json.dumps(tree))
+
+    def close(self):
+        """
+        Waits for the queued trees to be written, and closes the file.
+        Raises the error writing failed with, if any.
+        """
+        if self.thread is None:
+            return
+        self.lines.put(None)
+        self.thread.join()
+        self.thread = None
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+
+
+class ExampleArrays(object):
+    """
+    Values of the examples of a :py:class:`.Data` object held in NumPy
+    arrays, at fixed positions (see :meth:`.Data.useArrays`).
+
+    :param examples: The examples, in the order of their positions.
+    :param index: Dictionary mapping each example to its position.
+    :param values: Gradient (or regression value) of each example.
+    :param labels: 1 for positive examples and 0 for negative ones.
+    :param trueValues: True value of each example, for regression.
+    :param scores: Sum of the values of the trees learned so far for each
+                   example.
+    """
+
+    def __init__(self, examples):
+        """
+        :param examples: Examples, in the order their values are stored.
+        :type examples: list of str.
+        """
+        self.examples = list(examples)
+        self.index = dict((example, i) for i, example in enumerate(self.examples))
+        self.values = numpy.zeros(len(self.examples))
+        self.labels = numpy.zeros(len(self.examples))
+        self.trueValues = numpy.zeros(len(self.examples))
+        self.scores = numpy.zeros(len(self.examples))
+
+    def view(self, array, examples=None):
+        """
+        Returns a dictionary-like :py:class:`.ArrayView` of array for the
+        examples (all of them by default).
+        """
+        return ArrayView(self, array, examples)
+
+    def positions(self, examples):
+        """
+        Returns an array with the position of each of the examples.
+        """
+        index = self.index
+        return numpy.fromiter(
+            (index[example] for example in examples), dtype=numpy.intp, count=len(examples)
+        )
+
+    def gather(self, values):
+        """
+        Returns an array with the value of each example, given a dictionary
+        (or a view of an array, which is returned without copying).
+        """
+        if isinstance(values, ArrayView) and values.arrays is self and values.full:
+            return values.array
+        return numpy.array([values[example] for example in self.examples], dtype=float)
+
+
+class ArrayView(MutableMapping):
+    """
+    Dictionary mapping examples to their entries of an array of an
+    :py:class:`.ExampleArrays`. Values can be read and changed, but examples
+    cannot be added or removed.
+    """
+
+    def __init__(self, arrays, array, examples=None):
+        self.arrays = arrays
+        self.array = array
+        self.full = examples is None
+        if examples is None:
+            self.order = arrays.examples
+            self.positions = arrays.index
+        else:
+            self.order = list(examples)
+            self.positions = dict((e, arrays.index[e]) for e in self.order)
+
+    def __getitem__(self, example):
+        return float(self.array[self.positions[example]])
+
+    def __setitem__(self, example, value):
+        self.array[self.positions[example]] = value
+
+    def __delitem__(self, example):
+        raise TypeError("Examples cannot be removed from an array view.")
+
+    def __contains__(self, example):
+        return example in self.positions
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+
+class ExampleIndex(object):
+    """
+    Positions of examples, so that sets of them can be kept as bitsets: an
+    int with bit i set if the i-th example is in the set. The examples at
+    the nodes of a tree are bitsets over the examples at its root (see
+    :attr:`.node.exampleIndex`), and splitting a node is then an AND (and an
+    AND NOT) of bitsets.
+
+    .. code-block:: python
+
+                    from rfgb.utils import ExampleIndex
+
+                    index = ExampleIndex(["a(x)", "a(y)", "a(z)"])
+                    bits = index.bits(["a(x)", "a(z)"])
+                    # 0b101
+                    index.members(bits & ~index.bits(["a(x)"]))
+                    # ['a(z)']
+    """
+
+    def __init__(self, examples=()):
+        """
+        :param examples: Examples at the root.
+        :type examples: list of str.
+        """
+        self.examples = []
+        self.positions = {}
+        for example in examples:
+            self.intern(example)
+
+    def intern(self, example):
+        """
+        Returns the position of example, adding it to the index if it is new.
+        """
+        position = self.positions.get(example)
+        if position is None:
+            position = len(self.examples)
+            self.positions[example] = position
+            self.examples.append(example)
+        return position
+
+    def bits(self, examples):
         """
+        Returns the bitset of examples.
+        """
+        positions = self.positions
+        try:
+            indices = [positions[example] for example in examples]
+        except KeyError:
+            indices = [self.intern(example) for example in examples]
+        if not indices:
+            return 0
+        size = max(indices) // 8 + 1
+        if numpy is not None:
+            # Position i is bit i of the integer, so the flags are laid out
+            # from the highest position down and packed big-endian.
+            flags = numpy.zeros(8 * size, dtype=numpy.uint8)
+            flags[8 * size - 1 - numpy.array(indices, dtype=numpy.intp)] = 1
+            array = numpy.packbits(flags).tobytes()
+        else:
+            array = bytearray(size)
+            for i in indices:
+                array[size - 1 - (i >> 3)] |= 1 << (i & 7)
+            array = bytes(array)
+        return ExampleIndex._fromBytes(array)
 
-        # Create new input where each element is in its own set.
-        modifiedItemSets = []
-        for itemSet in itemSets:
-            modifiedItemSet = []
-            for element in itemSet:
-                modifiedItemSet.append([element])
-            modifiedItemSets.append(modifiedItemSet)
-
-        # Perform Cartesian Product of the first two sets.
-        while len(modifiedItemSets) > 1:
-            set1 = modifiedItemSets[0]
-            set2 = modifiedItemSets[1]
-            pairWiseProducts = []
-            for item1 in set1:
-                for item2 in set2:
-                    # Cartesian Product performed here.
-                    pairWiseProducts.append(item1 + item2)
-
-            # Remove the first two sets.
-            modifiedItemSets.remove(set1)
-            modifiedItemSets.remove(set2)
-            # Insert the Cartesian Product in their place and repeat.
-            modifiedItemSets.insert(0, pairWiseProducts)
-
-        # Return the final Cartesian Product Sets
-        return modifiedItemSets[0]
+    @staticmethod
+    def indices(bits):
+        """
+        Returns the positions of the examples in the bitset, in increasing
+        order.
+        """
+        if not bits:
+            return []
+        if numpy is not None:
+            array = numpy.frombuffer(ExampleIndex._toBytes(bits), dtype=numpy.uint8)
+            flags = numpy.unpackbits(array)
+            return (len(flags) - 1 - numpy.flatnonzero(flags)[::-1]).tolist()
+        binary = bin(bits)[:1:-1]
+        indices = []
+        position = binary.find("1")
+        while position >= 0:
+            indices.append(position)
+            position = binary.find("1", position + 1)
+        return indices
+
+    @staticmethod
+    def _fromBytes(array):
+        """
+        Returns the integer of the big-endian bytes array.
+        """
+        if hasattr(int, "from_bytes"):
+            return int.from_bytes(array, "big")
+        return int(hexlify(array), 16)
+
+    @staticmethod
+    def _toBytes(bits):
+        """
+        Returns the big-endian bytes of the non-negative integer bits.
+        """
+        size = (bits.bit_length() + 7) // 8
+        if hasattr(int, "to_bytes"):
+            return bits.to_bytes(size, "big")
+        return unhexlify("%0*x" % (2 * size, bits))
+
+    def members(self, bits):
+        """
+        Returns the examples in the bitset, in the order of the index.
+        """
+        examples = self.examples
+        return [examples[i] for i in ExampleIndex.indices(bits)]
+
+    @staticmethod
+    def count(bits):
+        """
+        Returns the number of examples in the bitset.
+        """
+        return bin(bits).count("1")
@@ -47,5 +47,9 @@ setup(
         'console_scripts': ['rfgb=rfgb.__main__']
     },
 
+    extras_require={
+        'numpy': ['numpy'],
+    },
+
     packages=find_packages(exclude=['tests'])
 )